@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from .redis_client import get_redis, get_async_redis
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+ANSWER_CACHE = os.getenv('ANSWER_CACHE', 'true').lower() == 'true'
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.97'))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv('ANSWER_CACHE_TTL_SECONDS', '300'))
+
+# Answers kept per (scope, source set); older ones are trimmed
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '16'))
+
+counters = {"hits": 0, "misses": 0, "errors": 0}
+
+def _generation_key(workspace_id: str) -> str:
+    return f"answer_gen:{workspace_id}"
+
+def _entries_key(workspace_id: str, scope: str, generation: int, source_ids: List[str]) -> str:
+    # Answers are only reusable for the same retrieved chunks, so they are bucketed by source set
+    sources = hashlib.sha256("\n".join(sorted(source_ids)).encode('utf-8')).hexdigest()
+    return f"answer:{workspace_id}:{scope}:{generation}:{sources}"
+
+def _encode(vector: List[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+async def lookup(
+    workspace_id: str,
+    scope: str,
+    query_vector: Optional[List[float]],
+    source_ids: List[str]
+) -> Optional[Dict]:
+    """Return a cached answer for a near-identical query over the same sources"""
+    # Window-only context has no query embedding to compare
+    if not ANSWER_CACHE or query_vector is None:
+        return None
+
+    try:
+        redis = get_async_redis()
+        generation = int(await redis.get(_generation_key(workspace_id)) or 0)
+        raw_entries = await redis.lrange(
+            _entries_key(workspace_id, scope, generation, source_ids), 0, -1
+        )
+    except Exception as e:
+        counters["errors"] += 1
+        logger.warning(f"Answer cache lookup failed: {str(e)}")
+        return None
+
+    if raw_entries:
+        entries = [json.loads(raw) for raw in raw_entries]
+        matrix = np.stack([_decode(entry["vector"]) for entry in entries])
+        query = np.asarray(query_vector, dtype=np.float32)
+        similarities = matrix @ query / (
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] >= ANSWER_CACHE_THRESHOLD:
+            counters["hits"] += 1
+            return {"response": entries[best]["response"], "similarity": float(similarities[best])}
+
+    counters["misses"] += 1
+    return None
+
+async def store(
+    workspace_id: str,
+    scope: str,
+    query_vector: Optional[List[float]],
+    source_ids: List[str],
+    response: str
+):
+    if not ANSWER_CACHE or query_vector is None:
+        return
+
+    try:
+        redis = get_async_redis()
+        generation = int(await redis.get(_generation_key(workspace_id)) or 0)
+        key = _entries_key(workspace_id, scope, generation, source_ids)
+        entry = json.dumps({
+            "vector": _encode(query_vector),
+            "response": response,
+            "createdAt": time.time()
+        })
+        pipe = redis.pipeline(transaction=False)
+        pipe.lpush(key, entry)
+        pipe.ltrim(key, 0, ANSWER_CACHE_MAX_ENTRIES - 1)
+        pipe.expire(key, ANSWER_CACHE_TTL_SECONDS)
+        await pipe.execute()
+    except Exception as e:
+        counters["errors"] += 1
+        logger.warning(f"Answer cache store failed: {str(e)}")
+
+def invalidate_workspace(workspace_id: str):
+    """Orphan every cached answer of a workspace after its vectors change"""
+    if not ANSWER_CACHE:
+        return
+
+    try:
+        get_redis().incr(_generation_key(workspace_id))
+    except Exception as e:
+        logger.warning(f"Answer cache invalidation failed for {workspace_id}: {str(e)}")
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from typing import Callable, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Messages gathered into one ingestion task; 1 keeps the one-task-per-message path
+MESSAGE_BATCH_SIZE = int(os.getenv('MESSAGE_BATCH_SIZE', '1'))
+MESSAGE_BATCH_LINGER_MS = int(os.getenv('MESSAGE_BATCH_LINGER_MS', '50'))
+
+# A batch the broker keeps refusing is retried this often, then dropped with an error log
+MESSAGE_BATCH_MAX_ATTEMPTS = int(os.getenv('MESSAGE_BATCH_MAX_ATTEMPTS', '10'))
+MESSAGE_BATCH_RETRY_SECONDS = float(os.getenv('MESSAGE_BATCH_RETRY_SECONDS', '1'))
+
+class MessageBatcher:
+    """Collects items on the event loop and flushes them by size or linger time
+
+    Flushing publishes in the default executor, since a broker publish blocks.
+    Failed batches are retried up to MESSAGE_BATCH_MAX_ATTEMPTS times and then
+    dropped; everything buffered, retried or publishing counts towards max_pending.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[dict]], None],
+        batch_size: int = MESSAGE_BATCH_SIZE,
+        linger_ms: int = MESSAGE_BATCH_LINGER_MS,
+        max_pending: Optional[int] = None
+    ):
+        self._flush = flush
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.max_pending = max_pending or batch_size * 10
+        self.dropped = 0
+        self._pending: List[dict] = []
+        # (batch, attempts so far) waiting for another try
+        self._retrying: List[Tuple[List[dict], int]] = []
+        self._publishing: Set[asyncio.Future] = set()
+        self._buffered = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.batch_size > 1
+
+    def add(self, item: dict):
+        # Refuse work rather than buffer without bound while the broker is failing
+        if self._buffered >= self.max_pending:
+            raise RuntimeError("Message batch buffer is full")
+
+        self._pending.append(item)
+        self._buffered += 1
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._schedule(self.linger)
+
+    def _schedule(self, delay: float):
+        self._timer = asyncio.get_running_loop().call_later(delay, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batches, self._retrying = self._retrying, []
+        if self._pending:
+            batches.append((self._pending, 0))
+            self._pending = []
+        for batch, attempts in batches:
+            future = asyncio.get_running_loop().run_in_executor(None, self._flush, batch)
+            self._publishing.add(future)
+            future.add_done_callback(lambda done, batch=batch, attempts=attempts: self._published(done, batch, attempts + 1))
+
+    def _published(self, future: asyncio.Future, batch: List[dict], attempts: int):
+        self._publishing.discard(future)
+        error = future.exception() if not future.cancelled() else None
+        if error is None:
+            self._buffered -= len(batch)
+            return
+
+        if attempts >= MESSAGE_BATCH_MAX_ATTEMPTS:
+            self._buffered -= len(batch)
+            self.dropped += len(batch)
+            logger.error(f"Dropped batch of {len(batch)} messages after {attempts} failed attempts: {str(error)}")
+            return
+
+        logger.error(f"Failed to flush batch of {len(batch)} messages: {str(error)}")
+        self._retrying.append((batch, attempts))
+        if self._timer is None:
+            self._schedule(MESSAGE_BATCH_RETRY_SECONDS)
+
+    async def aclose(self):
+        """Publish whatever is left and wait for it, e.g. at shutdown"""
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+        if self._pending or self._retrying:
+            self.flush()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
@@ -0,0 +1,83 @@
+import json
+import os
+import zlib
+from typing import AsyncIterator, Tuple, Union
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Messages per ingestion task and ingestion tasks allowed in flight per upload
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '256'))
+BULK_MAX_IN_FLIGHT = int(os.getenv('BULK_MAX_IN_FLIGHT', '8'))
+
+# Longest single NDJSON record accepted before the upload is rejected
+BULK_MAX_LINE_BYTES = int(os.getenv('BULK_MAX_LINE_BYTES', str(1024 * 1024)))
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+async def _decoded(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[bytes]:
+    """Body bytes, gunzipped when gzip is set or the body starts with the gzip magic"""
+    decompressor = zlib.decompressobj(wbits=31) if gzip else None
+    # Chunks can be a single byte, so the magic is only checked once two have arrived
+    head = b"" if not gzip else None
+
+    async for chunk in chunks:
+        if head is not None:
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            chunk, head = head, None
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(wbits=31)
+        if decompressor is None:
+            yield chunk
+            continue
+
+        # wbits=31 expects a gzip header; concatenated members each get a new decompressor
+        data = decompressor.decompress(chunk)
+        while decompressor.eof and decompressor.unused_data:
+            rest = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=31)
+            data += decompressor.decompress(rest)
+        yield data
+
+    if head:
+        yield head
+    if decompressor is not None:
+        yield decompressor.flush()
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    gzip: bool = False
+) -> AsyncIterator[Tuple[int, Union[dict, Exception]]]:
+    """Yield (line number, parsed record or parse error) from a plain or gzip NDJSON stream
+
+    Gzip is detected from the body; pass gzip=True when Content-Encoding says so.
+    """
+    buffer = b""
+    line_no = 0
+
+    async for chunk in _decoded(chunks, gzip):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            raise ValueError(f"NDJSON record after line {line_no} exceeds {BULK_MAX_LINE_BYTES} bytes")
+
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, _parse_line(line)
+
+    for line in buffer.split(b"\n"):
+        line_no += 1
+        if line.strip():
+            yield line_no, _parse_line(line)
+
+def _parse_line(line: bytes) -> Union[dict, Exception]:
+    try:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("record is not a JSON object")
+        return record
+    except Exception as e:
+        return e
@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Model whose tokenizer is used to measure prompt context
+CONTEXT_TOKENIZER_MODEL = os.getenv('CONTEXT_TOKENIZER_MODEL', 'gpt-4o-mini')
+
+# Token budgets for the retrieved context placed in each prompt
+MESSAGE_CONTEXT_TOKENS = int(os.getenv('MESSAGE_CONTEXT_TOKENS', '1500'))
+DOCUMENT_CONTEXT_TOKENS = int(os.getenv('DOCUMENT_CONTEXT_TOKENS', '3000'))
+
+# A truncated tail item shorter than this is dropped instead of included
+MIN_TRUNCATED_TOKENS = int(os.getenv('MIN_TRUNCATED_TOKENS', '32'))
+
+# After the tokenizer fails to load, token counts are estimated and loading is retried this often
+TOKENIZER_RETRY_SECONDS = float(os.getenv('TOKENIZER_RETRY_SECONDS', '30'))
+
+MESSAGE_SEPARATOR = "\n"
+DOCUMENT_SEPARATOR = "\n\n---\n\n"
+
+SENTENCE_END = re.compile(r'[.!?]["\')\]]?\s|\n')
+
+_lock = threading.Lock()
+_encoding = None
+_next_attempt = 0.0
+
+def get_encoding():
+    """tiktoken encoding for the chat model, or None while it cannot be loaded"""
+    global _encoding, _next_attempt
+
+    if _encoding is not None or time.monotonic() < _next_attempt:
+        return _encoding
+    # Callers arriving while another thread loads estimate rather than wait on the download
+    if not _lock.acquire(blocking=False):
+        return _encoding
+    try:
+        if _encoding is None and time.monotonic() >= _next_attempt:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model(CONTEXT_TOKENIZER_MODEL)
+            except Exception as e:
+                # tiktoken downloads its BPE files on first use
+                _next_attempt = time.monotonic() + TOKENIZER_RETRY_SECONDS
+                logger.warning(f"Could not load tokenizer, estimating token counts: {str(e)}")
+        return _encoding
+    finally:
+        _lock.release()
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def cut_to_tokens(text: str, max_tokens: int) -> str:
+    """First max_tokens tokens of text, wherever they end"""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Optional[str]:
+    """Longest prefix of text that fits max_tokens and ends at a sentence boundary"""
+    prefix = cut_to_tokens(text, max_tokens)
+
+    end = None
+    for match in SENTENCE_END.finditer(prefix):
+        end = match.start() + 1
+    if end is None:
+        return None
+    return prefix[:end].rstrip()
+
+def pack_context(
+    items: List[Tuple[str, float]],
+    budget: int,
+    separator: str = MESSAGE_SEPARATOR
+) -> Tuple[List[str], int]:
+    """Fit (text, score) items into a token budget, best score first
+
+    The first item that does not fit is cut at a sentence boundary and packing
+    stops there; if it is the best item and has no boundary in reach, it is cut
+    at the budget instead so the context is never empty. Returns the packed texts
+    and their token count, separators included.
+    """
+    separator_tokens = count_tokens(separator)
+    packed = []
+    used = 0
+
+    for text, score in sorted(items, key=lambda item: item[1], reverse=True):
+        cost = count_tokens(text) + (separator_tokens if packed else 0)
+        if used + cost <= budget:
+            packed.append(text)
+            used += cost
+            continue
+
+        remaining = budget - used - (separator_tokens if packed else 0)
+        if not packed and remaining > 0:
+            truncated = truncate_to_tokens(text, remaining) or cut_to_tokens(text, remaining).rstrip()
+            if truncated:
+                packed.append(truncated)
+                used += count_tokens(truncated)
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            truncated = truncate_to_tokens(text, remaining)
+            if truncated:
+                packed.append(truncated)
+                used += count_tokens(truncated) + (separator_tokens if len(packed) > 1 else 0)
+        break
+
+    return packed, used
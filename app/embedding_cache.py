@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+from .redis_client import get_redis, get_async_redis
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# In-process tier is bounded by the bytes of the vectors it holds
+EMBEDDING_CACHE_LRU_BYTES = int(os.getenv('EMBEDDING_CACHE_LRU_BYTES', str(64 * 1024 * 1024)))
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv('EMBEDDING_CACHE_TTL_SECONDS', str(24 * 3600)))
+
+# Also cache ingested texts, so duplicate messages and repeated boilerplate chunks are
+# embedded once; set to false to cache only search queries
+EMBEDDING_CACHE_DOCUMENTS = os.getenv('EMBEDDING_CACHE_DOCUMENTS', 'true').lower() == 'true'
+
+_whitespace = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    return _whitespace.sub(" ", text).strip()
+
+class LRUCache:
+    """Thread-safe LRU of float32 vectors with size-bounded eviction"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= old.nbytes
+            self._entries[key] = vector
+            self.size_bytes += vector.nbytes
+            while self.size_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from an LRU, then Redis, then the model
+
+    embed_documents goes straight to the model when EMBEDDING_CACHE_DOCUMENTS is off.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, dimensions: Optional[int] = None):
+        self.underlying = underlying
+        self.model = model
+        self.dimensions = dimensions
+        self.lru = LRUCache(EMBEDDING_CACHE_LRU_BYTES)
+        self.counters = {"lruHits": 0, "redisHits": 0, "misses": 0, "redisErrors": 0}
+        self._counter_lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        return f"emb:{self.model}:{self.dimensions or 'native'}:{digest}"
+
+    def _count(self, **amounts: int):
+        with self._counter_lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats["lruEntries"] = len(self.lru)
+        stats["lruBytes"] = self.lru.size_bytes
+        return stats
+
+    def _lookup_lru(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for key in keys:
+            vector = self.lru.get(key)
+            if vector is not None:
+                found[key] = vector
+        return found
+
+    def _remember(self, found: Dict[str, np.ndarray], raw: List[Optional[bytes]], keys: List[str]):
+        for key, value in zip(keys, raw):
+            if value is not None:
+                vector = np.frombuffer(value, dtype=np.float32)
+                self.lru.put(key, vector)
+                found[key] = vector
+
+    def _store(self, keys: List[str], vectors: List[List[float]], found: Dict[str, np.ndarray]) -> Dict[str, bytes]:
+        payload = {}
+        for key, values in zip(keys, vectors):
+            vector = np.asarray(values, dtype=np.float32)
+            self.lru.put(key, vector)
+            found[key] = vector
+            payload[key] = vector.tobytes()
+        return payload
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        found = self._lookup_lru(keys)
+        self._count(lruHits=len(found))
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            try:
+                before = len(found)
+                self._remember(found, get_redis().mget(missing), missing)
+                self._count(redisHits=len(found) - before)
+            except Exception as e:
+                self._count(redisErrors=1)
+                logger.warning(f"Embedding cache read failed: {str(e)}")
+
+        missing = [key for key in missing if key not in found]
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            vectors = self.underlying.embed_documents([texts_by_key[key] for key in missing])
+            self._count(misses=len(missing))
+            payload = self._store(missing, vectors, found)
+            try:
+                pipe = get_redis().pipeline(transaction=False)
+                for key, value in payload.items():
+                    pipe.set(key, value, ex=EMBEDDING_CACHE_TTL_SECONDS)
+                pipe.execute()
+            except Exception as e:
+                self._count(redisErrors=1)
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if EMBEDDING_CACHE_DOCUMENTS:
+            return self.embed_queries(texts)
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        found = self._lookup_lru(keys)
+        self._count(lruHits=len(found))
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            try:
+                before = len(found)
+                self._remember(found, await get_async_redis().mget(missing), missing)
+                self._count(redisHits=len(found) - before)
+            except Exception as e:
+                self._count(redisErrors=1)
+                logger.warning(f"Embedding cache read failed: {str(e)}")
+
+        missing = [key for key in missing if key not in found]
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            vectors = await self.underlying.aembed_documents([texts_by_key[key] for key in missing])
+            self._count(misses=len(missing))
+            payload = self._store(missing, vectors, found)
+            try:
+                pipe = get_async_redis().pipeline(transaction=False)
+                for key, value in payload.items():
+                    pipe.set(key, value, ex=EMBEDDING_CACHE_TTL_SECONDS)
+                await pipe.execute()
+            except Exception as e:
+                self._count(redisErrors=1)
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if EMBEDDING_CACHE_DOCUMENTS:
+            return await self.aembed_queries(texts)
+        return await self.underlying.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
@@ -0,0 +1,50 @@
+import os
+import threading
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from .openai_scheduler import create_http_client, create_async_http_client
+
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+# Shortened output size (e.g. 1024 or 256); unset keeps the model's native 3072
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '0')) or None
+
+# Serve repeated texts from the in-process LRU and Redis instead of OpenAI
+EMBEDDING_CACHE = os.getenv('EMBEDDING_CACHE', 'true').lower() == 'true'
+
+def create_embeddings(dimensions: Optional[int] = EMBEDDING_DIMENSIONS):
+    """Embeddings client producing vectors of the given size"""
+    # langchain_openai and the OpenAI SDK take about a second to import
+    from langchain_openai import OpenAIEmbeddings
+    from .embedding_cache import CachedEmbeddings
+
+    client = OpenAIEmbeddings(
+        openai_api_key=os.getenv('OPENAI_API_KEY'),
+        model=EMBEDDING_MODEL,
+        dimensions=dimensions,
+        http_client=create_http_client(),
+        http_async_client=create_async_http_client()
+    )
+    if EMBEDDING_CACHE:
+        return CachedEmbeddings(client, model=EMBEDDING_MODEL, dimensions=dimensions)
+    return client
+
+_lock = threading.Lock()
+_embeddings = None
+
+def get_embeddings():
+    """Process-wide embeddings client, created on first use or during warm-up"""
+    global _embeddings
+
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                _embeddings = create_embeddings()
+    return _embeddings
+
+def embedding_cache_stats() -> Optional[Dict[str, int]]:
+    """Counters of the cached client, or None when caching is off or no client exists yet"""
+    stats = getattr(_embeddings, "stats", None)
+    return stats() if stats else None
@@ -0,0 +1,387 @@
+import asyncio
+import base64
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+from urllib.parse import quote, unquote
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from .metadata_filter import filter_candidates, INDEXED_FIELDS
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+FAISS_INDEX_DIR = os.getenv('FAISS_INDEX_DIR', 'faiss_index')
+
+# Writes are appended to a per-shard log; the full index is rewritten once the log passes this size
+FAISS_SNAPSHOT_BYTES = int(os.getenv('FAISS_SNAPSHOT_BYTES', str(64 * 1024 * 1024)))
+
+def _normalized(vectors: List[List[float]]) -> np.ndarray:
+    # Inner product over unit vectors gives the same cosine score Pinecone returns
+    array = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    faiss.normalize_L2(array)
+    return array
+
+def _encode(values: np.ndarray) -> str:
+    return base64.b64encode(values.tobytes()).decode()
+
+def _decode(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+class FaissShard:
+    """One namespace: a flat inner-product index plus ID and metadata maps
+
+    On disk a shard is a snapshot (index and JSON maps) followed by a log of the
+    writes made since, one JSON line per upsert or delete batch. Writers append to
+    the log and only write a new snapshot once the log passes FAISS_SNAPSHOT_BYTES
+    (or on close); readers replay just the new log lines. Each snapshot and its log
+    carry a generation named by the .manifest file, which is swapped in with one
+    rename, so a reader never pairs a snapshot with another snapshot's log.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.manifest_path = f"{base_path}.manifest"
+        self.lock_path = f"{base_path}.lock"
+        # None until the first snapshot, and for shards written before manifests existed
+        self.generation: Optional[str] = None
+        self.manifest_version = None
+        self.log_inode: Optional[int] = None
+        self.log_offset = 0
+        self._reset()
+
+    def _reset(self):
+        self.index = None
+        self.labels: Dict[str, int] = {}
+        self.ids: Dict[int, str] = {}
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[tuple, Set[int]] = defaultdict(set)
+        self.next_label = 0
+
+    def _path(self, suffix: str, generation: Optional[str] = None) -> str:
+        return f"{self.base_path}.{suffix}" + (f".{generation}" if generation else "")
+
+    @property
+    def log_path(self) -> str:
+        return self._path("log", self.generation)
+
+    def _manifest_stat(self):
+        try:
+            stat = os.stat(self.manifest_path)
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _log_stat(self):
+        try:
+            stat = os.stat(self.log_path)
+            return stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            return None, 0
+
+    def stale(self) -> bool:
+        return (
+            self.manifest_version != self._manifest_stat()
+            or self._log_stat() != (self.log_inode, self.log_offset)
+        )
+
+    def refresh(self):
+        """Catch up with disk: replay new log lines, or reload everything after a snapshot"""
+        inode, size = self._log_stat()
+        if self.manifest_version != self._manifest_stat() or inode != self.log_inode or size < self.log_offset:
+            self.load()
+        elif size > self.log_offset:
+            self._replay(self.log_offset)
+
+    def load(self):
+        self._reset()
+        self.manifest_version = self._manifest_stat()
+        self.generation = None
+        if self.manifest_version is not None:
+            with open(self.manifest_path) as f:
+                self.generation = json.load(f)["generation"]
+
+        meta_path = self._path("json", self.generation)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                saved = json.load(f)
+            self.index = faiss.read_index(self._path("faiss", self.generation))
+            self.next_label = saved["nextLabel"]
+            for vid, label, metadata in saved["records"]:
+                self._remember(vid, label, metadata)
+        self.log_inode, _ = self._log_stat()
+        self.log_offset = 0
+        self._replay(0)
+
+    def _replay(self, offset: int):
+        if self.log_inode is None:
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written (or cut short by a crash) is picked up next time
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            if "upsert" in entry:
+                self._apply_upsert(
+                    np.stack([_decode(record["values"]) for record in entry["upsert"]]),
+                    [(record["id"], record["metadata"]) for record in entry["upsert"]]
+                )
+            else:
+                self._apply_delete(entry["delete"])
+        self.log_offset = offset + len(complete)
+
+    def _append_log(self, entry: Dict[str, Any]):
+        line = (json.dumps(entry) + "\n").encode()
+        with open(self.log_path, "ab") as f:
+            # Drop a partial line left by a writer that crashed mid-append
+            if f.tell() != self.log_offset:
+                f.truncate(self.log_offset)
+            f.write(line)
+        self.log_inode, _ = self._log_stat()
+        self.log_offset += len(line)
+
+    def save(self):
+        """Write a snapshot of the whole shard under a new generation with an empty log"""
+        previous, generation = self.generation, uuid.uuid4().hex
+        faiss.write_index(self.index, self._path("faiss", generation))
+        with open(self._path("json", generation), "w") as f:
+            json.dump({
+                "nextLabel": self.next_label,
+                "records": [[vid, label, self.metadata[label]] for vid, label in self.labels.items()]
+            }, f)
+        open(self._path("log", generation), "wb").close()
+
+        # The single atomic switch; files of a generation that never got here are ignored
+        tmp_manifest = f"{self.manifest_path}.tmp"
+        with open(tmp_manifest, "w") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        for suffix in ("faiss", "json", "log"):
+            try:
+                os.unlink(self._path(suffix, previous))
+            except FileNotFoundError:
+                pass
+        self.generation = generation
+        self.manifest_version = self._manifest_stat()
+        self.log_inode, self.log_offset = self._log_stat()
+
+    def maybe_save(self):
+        if self.index is not None and self.log_offset > FAISS_SNAPSHOT_BYTES:
+            self.save()
+
+    def _remember(self, vid: str, label: int, metadata: Dict[str, Any]):
+        self.labels[vid] = label
+        self.ids[label] = vid
+        self.metadata[label] = metadata
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self.postings[(field, metadata[field])].add(label)
+
+    def _forget(self, vid: str) -> Optional[int]:
+        label = self.labels.pop(vid, None)
+        if label is None:
+            return None
+        del self.ids[label]
+        metadata = self.metadata.pop(label)
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self.postings[(field, metadata[field])].discard(label)
+        return label
+
+    def candidates(self, filter: Dict[str, Any]) -> List[int]:
+        return filter_candidates(self.postings, self.metadata, filter)
+
+    def upsert(self, vectors: List[Dict[str, Any]]):
+        values = _normalized([vector["values"] for vector in vectors])
+        records = [(vector["id"], dict(vector.get("metadata") or {})) for vector in vectors]
+        self._apply_upsert(values, records)
+        self._append_log({"upsert": [
+            {"id": vid, "values": _encode(row), "metadata": metadata}
+            for (vid, metadata), row in zip(records, values)
+        ]})
+
+    def delete(self, ids: List[str]) -> int:
+        removed = self._apply_delete(ids)
+        if removed:
+            self._append_log({"delete": ids})
+        return removed
+
+    def _apply_upsert(self, values: np.ndarray, records: List[tuple]):
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(values.shape[1]))
+        elif values.shape[1] != self.index.d:
+            raise ValueError(f"Vector dimension {values.shape[1]} does not match index dimension {self.index.d}")
+
+        replaced = [label for label in (self._forget(vid) for vid, _ in records) if label is not None]
+        if replaced:
+            self.index.remove_ids(np.asarray(replaced, dtype=np.int64))
+
+        labels = np.arange(self.next_label, self.next_label + len(records), dtype=np.int64)
+        self.next_label += len(records)
+        self.index.add_with_ids(values, labels)
+        for (vid, metadata), label in zip(records, labels):
+            self._remember(vid, int(label), metadata)
+
+    def _apply_delete(self, ids: List[str]) -> int:
+        removed = [label for label in (self._forget(vid) for vid in ids) if label is not None]
+        if removed and self.index is not None:
+            self.index.remove_ids(np.asarray(removed, dtype=np.int64))
+        return len(removed)
+
+class FaissBackend:
+    """Local vector store with the same upsert/query/fetch/list/delete surface as Pinecone
+
+    Each namespace is a shard under FAISS_INDEX_DIR. Writers take an exclusive file
+    lock so Celery workers and the API can share the directory; readers replay the
+    writes other processes appended since they last looked.
+    """
+
+    def __init__(self, directory: str = FAISS_INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._shards: Dict[str, FaissShard] = {}
+        self._lock = threading.RLock()
+
+    def _get_shard(self, namespace: str) -> FaissShard:
+        shard = self._shards.get(namespace)
+        if shard is None:
+            name = quote(namespace, safe="") or "__default__"
+            shard = FaissShard(os.path.join(self.directory, name))
+            self._shards[namespace] = shard
+        return shard
+
+    @contextmanager
+    def _file_lock(self, shard: FaissShard, exclusive: bool):
+        with open(shard.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, namespace: str) -> FaissShard:
+        shard = self._get_shard(namespace)
+        if shard.stale():
+            with self._file_lock(shard, exclusive=False):
+                shard.refresh()
+        return shard
+
+    @contextmanager
+    def _write(self, namespace: str):
+        with self._lock:
+            shard = self._get_shard(namespace)
+            with self._file_lock(shard, exclusive=True):
+                if shard.stale():
+                    shard.refresh()
+                yield shard
+                shard.maybe_save()
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: str = ""
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            shard = self._read(namespace)
+            if shard.index is None or shard.index.ntotal == 0:
+                return []
+
+            params = None
+            k = min(top_k, shard.index.ntotal)
+            if filter:
+                labels = shard.candidates(filter)
+                if not labels:
+                    return []
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.asarray(labels, dtype=np.int64)))
+                k = min(k, len(labels))
+
+            scores, found = shard.index.search(_normalized([vector]), k, params=params)
+
+            matches = []
+            for score, label in zip(scores[0], found[0]):
+                if label < 0:
+                    continue
+                label = int(label)
+                match = {
+                    "id": shard.ids[label],
+                    "score": float(score),
+                    "metadata": dict(shard.metadata[label])
+                }
+                if include_values:
+                    match["values"] = shard.index.reconstruct(label).tolist()
+                matches.append(match)
+            return matches
+
+    async def aquery(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: str = ""
+    ) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.query, vector, top_k, filter, include_values, namespace)
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> int:
+        with self._write(namespace) as shard:
+            shard.upsert(vectors)
+        return len(vectors)
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            shard = self._read(namespace)
+            found = {}
+            for vid in ids:
+                label = shard.labels.get(vid)
+                if label is not None:
+                    found[vid] = {
+                        "id": vid,
+                        "values": shard.index.reconstruct(label).tolist(),
+                        "metadata": dict(shard.metadata[label])
+                    }
+            return found
+
+    def list_ids(self, prefix: str, namespace: str = "") -> Iterator[str]:
+        with self._lock:
+            ids = sorted(vid for vid in self._read(namespace).labels if vid.startswith(prefix))
+        return iter(ids)
+
+    def delete(self, ids: List[str], namespace: str = "") -> int:
+        with self._write(namespace) as shard:
+            return shard.delete(ids)
+
+    def namespaces(self) -> List[str]:
+        # Shards that have a snapshot have a manifest; others only a log, or files from before manifests
+        names = sorted({
+            os.path.splitext(name)[0] for name in os.listdir(self.directory)
+            if os.path.splitext(name)[1] in (".manifest", ".faiss", ".log")
+        })
+        return ["" if name == "__default__" else unquote(name) for name in names]
+
+    async def aclose(self):
+        pass
+
+    def close(self):
+        # Every write is already in a log; fold the logs into snapshots so the next start loads fast
+        with self._lock:
+            for shard in self._shards.values():
+                with self._file_lock(shard, exclusive=True):
+                    if shard.stale():
+                        shard.refresh()
+                    if shard.index is not None and shard.log_offset:
+                        shard.save()
+            self._shards.clear()
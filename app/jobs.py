@@ -0,0 +1,84 @@
+import time
+import uuid
+from typing import Any, Dict, Optional
+from .redis_client import get_redis
+
+# How long finished bulk job progress stays queryable
+JOB_TTL_SECONDS = 7 * 24 * 3600
+
+def _bulk_job_key(job_id: str) -> str:
+    return f"bulk_job:{job_id}"
+
+def create_bulk_job(job_id: Optional[str] = None) -> Optional[str]:
+    """Start a job's progress record; None if a job with that ID already exists"""
+    job_id = job_id or str(uuid.uuid4())
+    key = _bulk_job_key(job_id)
+    redis = get_redis()
+    # Claiming startedAt first keeps a reused ID from resetting another upload's counters
+    if not redis.hsetnx(key, "startedAt", time.time()):
+        return None
+    redis.hset(key, mapping={
+        "received": 0,
+        "invalid": 0,
+        "batchesQueued": 0,
+        "batchesDone": 0,
+        "indexed": 0,
+        "failed": 0,
+        "uploadComplete": 0,
+    })
+    redis.expire(key, JOB_TTL_SECONDS)
+    return job_id
+
+def update_bulk_job(job_id: str, **counts: int):
+    """Add to the job's counters; safe to call from any API or worker process"""
+    key = _bulk_job_key(job_id)
+    pipe = get_redis().pipeline()
+    for field, amount in counts.items():
+        pipe.hincrby(key, field, amount)
+    pipe.hset(key, "updatedAt", time.time())
+    pipe.execute()
+
+def finish_bulk_upload(job_id: str, error: Optional[str] = None):
+    key = _bulk_job_key(job_id)
+    mapping = {"uploadComplete": 1, "uploadFinishedAt": time.time()}
+    if error:
+        mapping["error"] = error
+    get_redis().hset(key, mapping=mapping)
+
+def get_bulk_job(job_id: str) -> Optional[Dict[str, Any]]:
+    raw = get_redis().hgetall(_bulk_job_key(job_id))
+    if not raw:
+        return None
+    job = {k.decode(): v.decode() for k, v in raw.items()}
+
+    counts = {
+        field: int(job[field])
+        for field in ("received", "invalid", "batchesQueued", "batchesDone", "indexed", "failed")
+    }
+    upload_complete = job["uploadComplete"] == "1"
+    done = upload_complete and counts["batchesDone"] >= counts["batchesQueued"]
+
+    if job.get("error"):
+        status = "failed"
+    elif done:
+        status = "completed"
+    elif upload_complete:
+        status = "indexing"
+    else:
+        status = "receiving"
+
+    started_at = float(job["startedAt"])
+    if done:
+        finished_at = max(float(job.get("updatedAt", started_at)), float(job.get("uploadFinishedAt", started_at)))
+    else:
+        finished_at = time.time()
+    elapsed = max(finished_at - started_at, 1e-6)
+
+    return {
+        "jobId": job_id,
+        "status": status,
+        **counts,
+        "elapsedSeconds": round(elapsed, 3),
+        "messagesPerSecond": round(counts["indexed"] / elapsed, 2),
+        "error": job.get("error"),
+    }
@@ -1,31 +1,55 @@
 import logging
-from datetime import datetime
-from typing import List
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, List, Tuple
 import os
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from .context_packer import MESSAGE_SEPARATOR, DOCUMENT_SEPARATOR
+from .openai_scheduler import create_http_client, create_async_http_client
+from .metrics import stage, tokens
+from .logging_config import setup_logging, log_contexts, truncate
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('rag_service.log'),
-        logging.StreamHandler()  # This will print to console as well
-    ]
-)
+setup_logging()
 
 logger = logging.getLogger('rag_service')
 
-# Initialize LLM
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.7,
-    openai_api_key=os.getenv('OPENAI_API_KEY')
-)
+def record_usage(message, call: str):
+    """Count prompt and completion tokens reported by the API"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    tokens("prompt", usage.get("input_tokens", 0), call=call)
+    tokens("completion", usage.get("output_tokens", 0), call=call)
+
+_lock = threading.Lock()
+_llm = None
+
+def get_llm():
+    """Process-wide chat client, created on first use or during warm-up"""
+    global _llm
+
+    if _llm is None:
+        with _lock:
+            if _llm is None:
+                # langchain_openai and the OpenAI SDK take about a second to import
+                from langchain_openai import ChatOpenAI
+                _llm = ChatOpenAI(
+                    model="gpt-4o-mini",
+                    temperature=0.7,
+                    openai_api_key=os.getenv('OPENAI_API_KEY'),
+                    # Streamed responses report token usage in their final chunk
+                    stream_usage=True,
+                    http_client=create_http_client(),
+                    http_async_client=create_async_http_client()
+                )
+    return _llm
+
+@lru_cache(maxsize=None)
+def get_prompt(messages: Tuple[Tuple[str, str], ...]):
+    """ChatPromptTemplate for one of the message tuples below, built once"""
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages(messages)
 
 # Define prompt template
-RESPONSE_PROMPT = ChatPromptTemplate.from_messages([
+RESPONSE_PROMPT = (
     ("system", """You are generating responses in a chat application. Respond as if you were the actual user.If there are previous messages, use them to match the user's style. If there are no previous messages, provide a natural, knowledgeable response to the current message.
 
 Guidelines:
@@ -42,10 +66,10 @@ Guidelines:
 Current message: {current_message}
 
 Generate a natural response:"""),
-])
+)
 
 # Define knowledge base prompt template
-KNOWLEDGE_BASE_PROMPT = ChatPromptTemplate.from_messages([
+KNOWLEDGE_BASE_PROMPT = (
     ("system", """You are an AI that creates extremely concise document summaries. Your responses must follow this exact format:
 
 1. One paragraph summary (2-3 sentences max)
@@ -64,70 +88,118 @@ Guidelines:
 Question: {current_message}
 
 Provide a concise summary following the required format:"""),
-])
+)
 
 async def generate_contextual_response(
     current_message: str,
     context_messages: List[str]
 ) -> str:
-    request_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-    
-    logger.info(f"[{request_id}] Generating response for message: {current_message}")
-    logger.info(f"[{request_id}] Context messages available: {len(context_messages)}")
+    logger.info(f"Generating response for message: {truncate(current_message)}")
+    logger.info(f"Context messages available: {len(context_messages)}")
     
     if context_messages:
-        logger.info(f"[{request_id}] Context messages:")
-        for i, msg in enumerate(context_messages):
-            logger.info(f"[{request_id}] Context[{i}]: {msg}")
+        log_contexts(logger, context_messages)
     else:
-        logger.info(f"[{request_id}] No context messages available")
+        logger.info("No context messages available")
 
-    context_str = "\n".join(context_messages) if context_messages else "No previous messages available."
+    context_str = MESSAGE_SEPARATOR.join(context_messages) if context_messages else "No previous messages available."
     
     try:
-        logger.info(f"[{request_id}] Calling LLM with prompt...")
-        response = await llm.ainvoke(
-            RESPONSE_PROMPT.format(
+        logger.info("Calling LLM with prompt...")
+        with stage("prompt_format", kind="contextual"):
+            prompt = get_prompt(RESPONSE_PROMPT).format(
                 context_messages=context_str,
                 current_message=current_message
             )
-        )
-        logger.info(f"[{request_id}] Generated response: {response.content}")
+        with stage("llm", kind="contextual"):
+            response = await get_llm().ainvoke(prompt)
+        record_usage(response, "contextual")
+        logger.info(f"Generated response: {truncate(response.content)}")
         return response.content
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error generating response: {str(e)}", exc_info=True)
+        logger.error(f"Error generating response: {str(e)}", exc_info=True)
         raise
 
 async def generate_knowledge_base_response(
     query: str,
     document_contexts: List[str]
 ) -> str:
-    request_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-    
-    logger.info(f"[{request_id}] Generating knowledge base response for query: {query}")
-    logger.info(f"[{request_id}] Document contexts available: {len(document_contexts)}")
+    logger.info(f"Generating knowledge base response for query: {truncate(query)}")
+    logger.info(f"Document contexts available: {len(document_contexts)}")
     
     if document_contexts:
-        logger.info(f"[{request_id}] Document contexts:")
-        for i, ctx in enumerate(document_contexts):
-            logger.info(f"[{request_id}] Context[{i}]: {ctx}")
+        log_contexts(logger, document_contexts)
     else:
-        logger.info(f"[{request_id}] No document contexts available")
+        logger.info("No document contexts available")
 
-    context_str = "\n\n---\n\n".join(document_contexts) if document_contexts else "No relevant documents found."
+    context_str = DOCUMENT_SEPARATOR.join(document_contexts) if document_contexts else "No relevant documents found."
     
     try:
-        logger.info(f"[{request_id}] Calling LLM with knowledge base prompt...")
-        response = await llm.ainvoke(
-            KNOWLEDGE_BASE_PROMPT.format(
+        logger.info("Calling LLM with knowledge base prompt...")
+        with stage("prompt_format", kind="knowledge_base"):
+            prompt = get_prompt(KNOWLEDGE_BASE_PROMPT).format(
                 context_messages=context_str,
                 current_message=query
             )
-        )
-        logger.info(f"[{request_id}] Generated response: {response.content}")
+        with stage("llm", kind="knowledge_base"):
+            response = await get_llm().ainvoke(prompt)
+        record_usage(response, "knowledge_base")
+        logger.info(f"Generated response: {truncate(response.content)}")
         return response.content
         
     except Exception as e:
-        logger.error(f"[{request_id}] Error generating response: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        logger.error(f"Error generating response: {str(e)}", exc_info=True)
+        raise
+
+async def stream_contextual_response(
+    current_message: str,
+    context_messages: List[str]
+) -> AsyncIterator[str]:
+    logger.info(f"Streaming response for message: {truncate(current_message)}")
+    logger.info(f"Context messages available: {len(context_messages)}")
+
+    context_str = MESSAGE_SEPARATOR.join(context_messages) if context_messages else "No previous messages available."
+    
+    try:
+        with stage("prompt_format", kind="contextual"):
+            prompt = get_prompt(RESPONSE_PROMPT).format(
+                context_messages=context_str,
+                current_message=current_message
+            )
+        with stage("llm_stream", kind="contextual"):
+            async for chunk in get_llm().astream(prompt):
+                record_usage(chunk, "contextual")
+                if chunk.content:
+                    yield chunk.content
+        logger.info("Finished streaming response")
+        
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}", exc_info=True)
+        raise
+
+async def stream_knowledge_base_response(
+    query: str,
+    document_contexts: List[str]
+) -> AsyncIterator[str]:
+    logger.info(f"Streaming knowledge base response for query: {truncate(query)}")
+    logger.info(f"Document contexts available: {len(document_contexts)}")
+
+    context_str = DOCUMENT_SEPARATOR.join(document_contexts) if document_contexts else "No relevant documents found."
+    
+    try:
+        with stage("prompt_format", kind="knowledge_base"):
+            prompt = get_prompt(KNOWLEDGE_BASE_PROMPT).format(
+                context_messages=context_str,
+                current_message=query
+            )
+        with stage("llm_stream", kind="knowledge_base"):
+            async for chunk in get_llm().astream(prompt):
+                record_usage(chunk, "knowledge_base")
+                if chunk.content:
+                    yield chunk.content
+        logger.info("Finished streaming knowledge base response")
+        
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}", exc_info=True)
+        raise
@@ -0,0 +1,117 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional
+from dotenv import load_dotenv
+from .tracing import TraceIdFilter
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
+
+# Rotated at LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files
+LOG_FILE = os.getenv('LOG_FILE', 'rag_service.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+
+# Records waiting for the writer thread; beyond this they are dropped rather than block a request
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Share of LLM calls whose full context is logged at INFO; the rest log it only at DEBUG
+LOG_CONTEXT_SAMPLE_RATE = float(os.getenv('LOG_CONTEXT_SAMPLE_RATE', '0.0'))
+
+# Queries, context items and responses are cut to this many characters in the log
+LOG_TRUNCATE_CHARS = int(os.getenv('LOG_TRUNCATE_CHARS', '200'))
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues without blocking, counting records dropped while the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+_lock = threading.Lock()
+
+def _output_handlers() -> List[logging.Handler]:
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT),
+        logging.StreamHandler()  # This will print to console as well
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def _start_listener():
+    global _listener, _listener_pid
+    _listener = QueueListener(_handler.queue, *_output_handlers(), respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+def setup_logging():
+    """Route the root logger through a queue to a background writer thread (idempotent)"""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        # Filters run on the logging thread, where the request's trace ID is set
+        _handler.addFilter(TraceIdFilter())
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        _start_listener()
+    atexit.register(stop_logging)
+
+def restart_after_fork():
+    """Give a forked child (a Celery pool process) its own queue and writer thread"""
+    global _listener
+    with _lock:
+        # Nothing to do when logging was first set up in this very process
+        if _handler is None or _listener_pid == os.getpid():
+            return
+        # The parent's writer thread does not exist in the child
+        _listener = None
+        _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _start_listener()
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+def truncate(text: str, limit: int = LOG_TRUNCATE_CHARS) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... (+{len(text) - limit} chars)"
+
+def log_contexts(logger: logging.Logger, contexts: List[str]):
+    """Log each context item at INFO for a sample of calls, otherwise only when DEBUG is on"""
+    if LOG_CONTEXT_SAMPLE_RATE and random.random() < LOG_CONTEXT_SAMPLE_RATE:
+        level = logging.INFO
+    elif logger.isEnabledFor(logging.DEBUG):
+        level = logging.DEBUG
+    else:
+        return
+    for i, ctx in enumerate(contexts):
+        logger.log(level, f"Context[{i}]: {truncate(ctx)}")
@@ -1,30 +1,187 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 from .schemas import (
-    MessageEvent, SearchQuery, SearchResult, AIResponse, 
+    MessageEvent, BulkJobStatus, SearchQuery, SearchResult, AIResponse, 
+    BatchSearchRequest, BatchSearchItem, BatchSearchResponse,
     GenerateRequest, ProcessDocumentRequest, ProcessDocumentResponse,
     DeleteVectorsRequest, DeleteVectorsResponse,
-    KnowledgeBaseRequest
+    DeleteDocumentRequest, DeleteDocumentResponse,
+    KnowledgeBaseRequest, JobResponse, JobStatus, ReembedRequest
 )
-from .processor import process_message, embeddings, process_document, delete_vectors
-from .llm import generate_contextual_response, generate_knowledge_base_response
-from langchain_pinecone import PineconeVectorStore
-import os
+from .processor import (
+    celery_app, process_message, process_message_batch, process_document, delete_vectors,
+    delete_document, migrate_to_namespaces, reembed_vectors, rebuild_mirror
+)
+from .llm import (
+    generate_contextual_response, generate_knowledge_base_response,
+    stream_contextual_response, stream_knowledge_base_response
+)
+from .vectorstore import (
+    close_vector_store, aclose_async_client,
+    namespace_for, MESSAGES, DOCUMENTS
+)
+from .retrieval import (
+    aembed_query, aembed_queries, asimilarity_search_by_vector_with_score,
+    ahybrid_search_with_score, reciprocal_rank_fusion
+)
+from .sparse_index import HYBRID_RETRIEVAL
+from . import answer_cache, singleflight, message_window, warmup
+from .singleflight import request_key
+from .context_packer import (
+    pack_context, MESSAGE_CONTEXT_TOKENS, DOCUMENT_CONTEXT_TOKENS,
+    MESSAGE_SEPARATOR, DOCUMENT_SEPARATOR
+)
+from .batching import MessageBatcher
+from .bulk import iter_ndjson_lines, BULK_BATCH_SIZE, BULK_MAX_IN_FLIGHT
+from .jobs import create_bulk_job, update_bulk_job, finish_bulk_upload, get_bulk_job
+from .embeddings import embedding_cache_stats
+from .redis_client import aclose_async_redis
+from .openai_scheduler import scheduler
+from . import metrics
+from .metrics import stage, tokens
+from .tracing import TRACE_HEADER, trace_id_from_header, set_trace_id, reset_trace_id
+from .logging_config import dropped_records, stop_logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Slack RAG Service")
+# Queries accepted by /search/batch, and how many of them hit the index at once
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv('SEARCH_BATCH_MAX_QUERIES', '32'))
+SEARCH_BATCH_CONCURRENCY = int(os.getenv('SEARCH_BATCH_CONCURRENCY', '8'))
+
+message_batcher = MessageBatcher(flush=lambda batch: process_message_batch.delay(batch))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Modules, clients, the Pinecone handshake and the tokenizer load in the background
+    # so the server accepts connections at once; /ready reports when they are done
+    warm_up_task = asyncio.create_task(warmup.warm_up())
+    yield
+    warm_up_task.cancel()
+    await message_batcher.aclose()
+    await aclose_async_client()
+    await aclose_async_redis()
+    close_vector_store()
+    stop_logging()
+
+app = FastAPI(title="Slack RAG Service", lifespan=lifespan)
+
+@app.middleware("http")
+async def trace_and_time_requests(request: Request, call_next):
+    """Give every request a trace ID and record its latency by route"""
+    trace_id = trace_id_from_header(request.headers.get(TRACE_HEADER))
+    token = set_trace_id(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = trace_id
+        return response
+    finally:
+        # Route templates keep label cardinality bounded (/jobs/{job_id}, not each ID)
+        route = request.scope.get("route")
+        metrics.observe(
+            "rag_http_request_seconds",
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+        reset_trace_id(token)
+
+@app.get("/ready")
+async def readiness():
+    """200 once modules are loaded and clients are warm, 503 until then"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 @app.post("/message-event")
 async def handle_message_event(message: MessageEvent):
     """Queue a message for processing"""
     try:
+        # Keep the conversation's recent messages at hand for window-mode /generate
+        await message_window.record(message.dict())
+
         # Queue the message for processing
-        process_message.delay(message.dict())
+        if message_batcher.enabled:
+            message_batcher.add(message.dict())
+        else:
+            await run_in_threadpool(process_message.delay, message.dict())
         return {"status": "queued", "messageId": message.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/message-event/bulk", response_model=BulkJobStatus, status_code=202)
+async def handle_bulk_message_events(request: Request, jobId: Optional[str] = None):
+    """Index a streamed NDJSON (optionally gzip) body of message events"""
+    # A caller-supplied jobId lets progress be polled while the upload is still streaming
+    # Redis and broker calls are blocking, so they run in the threadpool
+    job_id = await run_in_threadpool(create_bulk_job, jobId)
+    if job_id is None:
+        raise HTTPException(status_code=409, detail="Job already exists")
+    in_flight = []
+    batch = []
+    invalid = 0
+
+    def pending(tasks):
+        return [task for task in tasks if not task.ready()]
+
+    async def dispatch(messages):
+        nonlocal invalid
+        # Bound parallelism so a fast upload cannot flood the broker
+        while len(in_flight) >= BULK_MAX_IN_FLIGHT:
+            in_flight[:] = await run_in_threadpool(pending, in_flight)
+            if len(in_flight) >= BULK_MAX_IN_FLIGHT:
+                await asyncio.sleep(0.05)
+        in_flight.append(await run_in_threadpool(process_message_batch.delay, messages, job_id))
+        counts, invalid = {"batchesQueued": 1, "received": len(messages), "invalid": invalid}, 0
+        await run_in_threadpool(update_bulk_job, job_id, **counts)
+
+    try:
+        gzip = request.headers.get("content-encoding", "").lower() == "gzip"
+        async for line_no, record in iter_ndjson_lines(request.stream(), gzip=gzip):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                batch.append(MessageEvent(**record).dict())
+            except (ValueError, ValidationError):
+                # Counted locally and reported with the next batch
+                invalid += 1
+                continue
+
+            if len(batch) >= BULK_BATCH_SIZE:
+                await dispatch(batch)
+                batch = []
+
+        if batch:
+            await dispatch(batch)
+        error = None
+    except Exception as e:
+        error = str(e)
+
+    if invalid:
+        await run_in_threadpool(update_bulk_job, job_id, invalid=invalid)
+    await run_in_threadpool(finish_bulk_upload, job_id, error=error)
+
+    return await run_in_threadpool(get_bulk_job, job_id)
+
+@app.get("/message-event/bulk/{job_id}", response_model=BulkJobStatus)
+async def get_bulk_message_job(job_id: str):
+    """Report progress and throughput of a bulk ingestion job"""
+    job = await run_in_threadpool(get_bulk_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/search")
 async def search_messages(query: SearchQuery):
     """Search for relevant messages"""
@@ -35,73 +192,271 @@ async def search_messages(query: SearchQuery):
             "userId": query.receiverId
         }
 
-        vector_store = PineconeVectorStore.from_existing_index(
-            index_name=os.getenv('PINECONE_INDEX'),
-            embedding=embeddings
-        )
-        
-        results = vector_store.similarity_search(
-            query.query,
-            k=query.limit,
-            filter=filter_dict
-        )
+        with stage("embed_query", endpoint="search"):
+            query_vector = await aembed_query(query.query)
+        with stage("vector_query", endpoint="search"):
+            results = await asimilarity_search_by_vector_with_score(
+                query_vector,
+                k=query.limit,
+                filter=filter_dict,
+                namespace=namespace_for(query.workspaceId, MESSAGES)
+            )
         
         messages = [
             SearchResult(
                 content=doc.page_content,
                 messageId=doc.metadata["messageId"]
-            ) for doc in results
+            ) for doc, score in results
         ]
         
         return {"messages": messages}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate", response_model=AIResponse)
-async def generate_response(query: GenerateRequest):
-    """Generate an AI response using RAG context"""
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_messages_batch(request: BatchSearchRequest):
+    """Run several searches with one embedding request, returning results in order"""
+    if len(request.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {SEARCH_BATCH_MAX_QUERIES} queries per batch"
+        )
+
     try:
-        # Build filter based on workspace and sender
-        filter_dict = {
-            "workspaceId": query.workspaceId,
-            "userId": query.receiverId
-        }
+        with stage("embed_query", endpoint="search_batch"):
+            vectors = await aembed_queries([query.query for query in request.queries])
+    except Exception as e:
+        return BatchSearchResponse(results=[BatchSearchItem(error=str(e)) for _ in request.queries])
 
-        vector_store = PineconeVectorStore.from_existing_index(
-            index_name=os.getenv('PINECONE_INDEX'),
-            embedding=embeddings
-        )
-        
-        # Get relevant context messages
-        results = vector_store.similarity_search_with_score(
-            query.query,
+    semaphore = asyncio.Semaphore(SEARCH_BATCH_CONCURRENCY)
+
+    async def search_one(query: SearchQuery, vector: List[float]) -> BatchSearchItem:
+        try:
+            async with semaphore:
+                with stage("vector_query", endpoint="search_batch"):
+                    results = await asimilarity_search_by_vector_with_score(
+                        vector,
+                        k=query.limit,
+                        filter={"workspaceId": query.workspaceId, "userId": query.receiverId},
+                        namespace=namespace_for(query.workspaceId, MESSAGES)
+                    )
+            return BatchSearchItem(messages=[
+                SearchResult(
+                    content=doc.page_content,
+                    messageId=doc.metadata["messageId"]
+                ) for doc, score in results
+            ])
+        except Exception as e:
+            return BatchSearchItem(error=str(e))
+
+    items = await asyncio.gather(*(
+        search_one(query, vector) for query, vector in zip(request.queries, vectors)
+    ))
+    return BatchSearchResponse(results=items)
+
+async def search_messages_by_vector(query: GenerateRequest):
+    """Embed the query and fetch the receiver's most relevant messages"""
+    # Build filter based on workspace and sender
+    filter_dict = {
+        "workspaceId": query.workspaceId,
+        "userId": query.receiverId
+    }
+
+    with stage("embed_query", endpoint="generate"):
+        query_vector = await aembed_query(query.query)
+    with stage("vector_query", endpoint="generate"):
+        results = await asimilarity_search_by_vector_with_score(
+            query_vector,
             k=query.limit,
-            filter=filter_dict
+            filter=filter_dict,
+            namespace=namespace_for(query.workspaceId, MESSAGES)
         )
-        
-        # Convert to source messages
-        source_messages = [
-            SearchResult(
-                content=doc.page_content,
-                messageId=doc.metadata["messageId"]
-            ) for doc, score in results
-        ]
-        
+    return query_vector, results
+
+async def retrieve_message_context(query: GenerateRequest):
+    """Fetch context messages for the query's contextMode; the vector is None when no search ran"""
+    query_vector = None
+    if query.contextMode == "vector":
+        query_vector, results = await search_messages_by_vector(query)
+    else:
+        with stage("window_lookup", endpoint="generate"):
+            window = await message_window.recent(
+                query.workspaceId, query.receiverId, query.channelId, query.limit
+            )
+        if query.contextMode == "window" and len(window) >= query.limit:
+            # A hot conversation answers from its recent messages without an embedding or ANN query
+            results = window
+        else:
+            query_vector, searched = await search_messages_by_vector(query)
+            results = reciprocal_rank_fusion([window, searched], query.limit)
+
+    # Convert to source messages
+    source_messages = [
+        SearchResult(
+            content=doc.page_content,
+            messageId=doc.metadata["messageId"]
+        ) for doc, score in results
+    ]
+    return query_vector, results, source_messages
+
+async def retrieve_document_context(query: KnowledgeBaseRequest):
+    """Embed the query and fetch the workspace's most relevant document chunks"""
+    # Build filter based on workspace only
+    filter_dict = {
+        "workspaceId": query.workspaceId
+    }
+
+    with stage("embed_query", endpoint="knowledge_base"):
+        query_vector = await aembed_query(query.query)
+    if HYBRID_RETRIEVAL:
+        with stage("hybrid_query", endpoint="knowledge_base"):
+            results = await ahybrid_search_with_score(
+                query.query,
+                query_vector,
+                query.workspaceId,
+                k=query.limit,
+                filter=filter_dict,
+                namespace=namespace_for(query.workspaceId, DOCUMENTS)
+            )
+    else:
+        with stage("vector_query", endpoint="knowledge_base"):
+            results = await asimilarity_search_by_vector_with_score(
+                query_vector,
+                k=query.limit,
+                filter=filter_dict,
+                namespace=namespace_for(query.workspaceId, DOCUMENTS)
+            )
+
+    source_messages = [
+        SearchResult(
+            content=doc.page_content,
+            documentId=doc.metadata.get("documentId"),
+            documentName=doc.metadata.get("fileName")
+        ) for doc, score in results
+    ]
+    return query_vector, results, source_messages
+
+def pack_results(results, budget: int, separator: str):
+    """Fit retrieved chunks into the prompt's token budget, best score first"""
+    with stage("pack_context"):
+        contexts, context_tokens = pack_context(
+            [(doc.page_content, score) for doc, score in results], budget, separator
+        )
+    tokens("context", context_tokens)
+    return contexts, context_tokens
+
+def ndjson_event(event: dict) -> bytes:
+    return (json.dumps(event) + "\n").encode()
+
+async def stream_answer(
+    workspace_id: str,
+    scope: str,
+    query_vector: List[float],
+    results,
+    source_messages: List[SearchResult],
+    context_tokens: int,
+    generate_tokens: Callable[[], AsyncIterator[str]]
+) -> AsyncIterator[bytes]:
+    """Send sources as soon as retrieval is done, then forward LLM tokens as they arrive"""
+    yield ndjson_event({
+        "type": "sources",
+        "confidence": 1.0 if results else 0.5,
+        "sourceMessages": [msg.dict() for msg in source_messages],
+        "contextTokens": context_tokens
+    })
+
+    source_ids = [doc.id for doc, score in results]
+    with stage("answer_cache_lookup"):
+        cached = await answer_cache.lookup(workspace_id, scope, query_vector, source_ids)
+    if cached is not None:
+        yield ndjson_event({"type": "token", "content": cached["response"]})
+        yield ndjson_event({"type": "done", "cached": True})
+        return
+
+    parts = []
+    try:
+        async for token in generate_tokens():
+            parts.append(token)
+            yield ndjson_event({"type": "token", "content": token})
+    except Exception as e:
+        yield ndjson_event({"type": "error", "detail": str(e)})
+        return
+
+    await answer_cache.store(workspace_id, scope, query_vector, source_ids, "".join(parts))
+    yield ndjson_event({"type": "done", "cached": False})
+
+async def answer_message_query(query: GenerateRequest) -> dict:
+    """Retrieve message context and answer with the LLM, reusing cached answers"""
+    # Get relevant context messages
+    query_vector, results, source_messages = await retrieve_message_context(query)
+    source_ids = [doc.id for doc, score in results]
+
+    # Reuse the answer to a near-identical question over the same context
+    with stage("answer_cache_lookup"):
+        cached = await answer_cache.lookup(
+            query.workspaceId, f"receiver:{query.receiverId}", query_vector, source_ids
+        )
+    context_tokens = None
+    if cached is not None:
+        response = cached["response"]
+    else:
+        contexts, context_tokens = pack_results(results, MESSAGE_CONTEXT_TOKENS, MESSAGE_SEPARATOR)
+
         # Generate response using LLM
         response = await generate_contextual_response(
             current_message=query.query,
-            context_messages=[msg.content for msg in source_messages]
+            context_messages=contexts
         )
-        
-        return AIResponse(
-            response=response,
-            confidence=1.0 if results else 0.5,
-            sourceMessages=source_messages
+        await answer_cache.store(
+            query.workspaceId, f"receiver:{query.receiverId}", query_vector, source_ids, response
+        )
+
+    return AIResponse(
+        response=response,
+        confidence=1.0 if results else 0.5,
+        sourceMessages=source_messages,
+        cached=cached is not None,
+        contextTokens=context_tokens
+    ).dict()
+
+@app.post("/generate", response_model=AIResponse)
+async def generate_response(query: GenerateRequest):
+    """Generate an AI response using RAG context"""
+    try:
+        # Identical concurrent requests share one retrieval and generation
+        result = await singleflight.do(
+            request_key("generate", query.dict()), lambda: answer_message_query(query)
         )
+        return AIResponse(**result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_response_stream(query: GenerateRequest):
+    """Stream an AI response as NDJSON, sending source messages before any tokens"""
+    try:
+        query_vector, results, source_messages = await retrieve_message_context(query)
+        contexts, context_tokens = pack_results(results, MESSAGE_CONTEXT_TOKENS, MESSAGE_SEPARATOR)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        stream_answer(
+            query.workspaceId,
+            f"receiver:{query.receiverId}",
+            query_vector,
+            results,
+            source_messages,
+            context_tokens,
+            lambda: stream_contextual_response(
+                current_message=query.query,
+                context_messages=contexts
+            )
+        ),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/process-document", response_model=ProcessDocumentResponse)
 async def handle_process_document(request: ProcessDocumentRequest):
     """Process a document for RAG"""
@@ -112,9 +467,11 @@ async def handle_process_document(request: ProcessDocumentRequest):
             request.workspaceId,
             request.fileUrl,
             request.fileName,
-            request.fileType
+            request.fileType,
+            request.callbackUrl,
+            request.callbackToken
         )
-        result = task.get()  # Wait for the result
+        result = await run_in_threadpool(task.get)  # Wait without blocking the event loop
         return result
     except Exception as e:
         return ProcessDocumentResponse(
@@ -123,67 +480,172 @@ async def handle_process_document(request: ProcessDocumentRequest):
             error=str(e)
         ) 
 
-# @app.post("/delete-document", response_model=DeleteDocumentResponse)
-# async def handle_delete_document(request: DeleteDocumentRequest):
-#     """Delete a document and its chunks from the vector store"""
-#     try:
-#         # Queue the delete task
-#         task = delete_document.delay(
-#             request.documentId,
-#             request.workspaceId,
-#             request.callbackUrl,
-#             request.callbackToken
-#         )
-#         result = task.get()  # Wait for the result
-#         return result
-#     except Exception as e:
-#         return DeleteDocumentResponse(
-#             success=False,
-#             error=str(e)
-#         ) 
+@app.post("/process-document/jobs", response_model=JobResponse, status_code=202)
+async def handle_process_document_job(request: ProcessDocumentRequest):
+    """Queue a document for processing and return its job ID immediately"""
+    try:
+        task = process_document.delay(
+            request.documentId,
+            request.workspaceId,
+            request.fileUrl,
+            request.fileName,
+            request.fileType,
+            request.callbackUrl,
+            request.callbackToken
+        )
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/knowledge-base/generate", response_model=AIResponse)
-async def handle_knowledge_base_generate(query: KnowledgeBaseRequest):
-    """Generate an AI response using workspace documents"""
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """Report the state and stage progress of a document or delete job"""
     try:
-        # Build filter based on workspace only
-        filter_dict = {
-            "workspaceId": query.workspaceId
-        }
+        task = celery_app.AsyncResult(job_id)
+        state = task.state
+
+        if state == "PROGRESS":
+            progress = dict(task.info or {})
+            return JobStatus(
+                jobId=job_id,
+                status="running",
+                stage=progress.pop("stage", None),
+                progress=progress
+            )
+        if state == "SUCCESS":
+            result = task.result or {}
+            return JobStatus(
+                jobId=job_id,
+                status="completed" if result.get("success") else "failed",
+                result=result,
+                error=result.get("error")
+            )
+        if state == "FAILURE":
+            return JobStatus(jobId=job_id, status="failed", error=str(task.result))
+
+        # Celery reports unknown IDs as PENDING too
+        return JobStatus(jobId=job_id, status=state.lower())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        vector_store = PineconeVectorStore.from_existing_index(
-            index_name=os.getenv('PINECONE_INDEX'),
-            embedding=embeddings
+@app.post("/delete-document", response_model=DeleteDocumentResponse)
+async def handle_delete_document(request: DeleteDocumentRequest):
+    """Delete a document and its chunks from the vector store"""
+    try:
+        # Queue the delete task
+        task = delete_document.delay(
+            request.documentId,
+            request.workspaceId,
+            request.callbackUrl,
+            request.callbackToken
         )
-        
-        # Get relevant context from documents
-        results = vector_store.similarity_search_with_score(
-            query.query,
-            k=query.limit,
-            filter=filter_dict
+        result = await run_in_threadpool(task.get)  # Wait without blocking the event loop
+        return result
+    except Exception as e:
+        return DeleteDocumentResponse(
+            success=False,
+            documentId=request.documentId,
+            error=str(e)
         )
-        
+
+@app.post("/delete-document/jobs", response_model=JobResponse, status_code=202)
+async def handle_delete_document_job(request: DeleteDocumentRequest):
+    """Queue a document deletion and return its job ID immediately"""
+    try:
+        task = delete_document.delay(
+            request.documentId,
+            request.workspaceId,
+            request.callbackUrl,
+            request.callbackToken
+        )
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def answer_knowledge_base_query(query: KnowledgeBaseRequest) -> dict:
+    """Retrieve document context and answer with the LLM, reusing cached answers"""
+    # Get relevant context from documents
+    query_vector, results, source_messages = await retrieve_document_context(query)
+    source_ids = [doc.id for doc, score in results]
+
+    # Reuse the answer to a near-identical question over the same documents
+    with stage("answer_cache_lookup"):
+        cached = await answer_cache.lookup(
+            query.workspaceId, "knowledge-base", query_vector, source_ids
+        )
+    context_tokens = None
+    if cached is not None:
+        response = cached["response"]
+    else:
+        contexts, context_tokens = pack_results(results, DOCUMENT_CONTEXT_TOKENS, DOCUMENT_SEPARATOR)
+
         # Generate response using knowledge base LLM prompt
         response = await generate_knowledge_base_response(
             query=query.query,
-            document_contexts=[doc.page_content for doc, score in results]
+            document_contexts=contexts
         )
-        
-        return AIResponse(
-            response=response,
-            confidence=1.0 if results else 0.5,
-            sourceMessages=[
-                SearchResult(
-                    content=doc.page_content,
-                    documentId=doc.metadata.get("documentId"),
-                    documentName=doc.metadata.get("fileName")
-                ) for doc, score in results
-            ]
+        await answer_cache.store(
+            query.workspaceId, "knowledge-base", query_vector, source_ids, response
         )
+
+    return AIResponse(
+        response=response,
+        confidence=1.0 if results else 0.5,
+        sourceMessages=source_messages,
+        cached=cached is not None,
+        contextTokens=context_tokens
+    ).dict()
+
+@app.post("/knowledge-base/generate", response_model=AIResponse)
+async def handle_knowledge_base_generate(query: KnowledgeBaseRequest):
+    """Generate an AI response using workspace documents"""
+    try:
+        # Identical concurrent requests share one retrieval and generation
+        result = await singleflight.do(
+            request_key("knowledge-base", query.dict()), lambda: answer_knowledge_base_query(query)
+        )
+        return AIResponse(**result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/knowledge-base/generate/stream")
+async def handle_knowledge_base_generate_stream(query: KnowledgeBaseRequest):
+    """Stream a knowledge base response as NDJSON, sending sources before any tokens"""
+    try:
+        query_vector, results, source_messages = await retrieve_document_context(query)
+        contexts, context_tokens = pack_results(results, DOCUMENT_CONTEXT_TOKENS, DOCUMENT_SEPARATOR)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        stream_answer(
+            query.workspaceId,
+            "knowledge-base",
+            query_vector,
+            results,
+            source_messages,
+            context_tokens,
+            lambda: stream_knowledge_base_response(
+                query=query.query,
+                document_contexts=contexts
+            )
+        ),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/delete-vectors/jobs", response_model=JobResponse, status_code=202)
+async def handle_delete_vectors_job(request: DeleteVectorsRequest):
+    """Queue a vector deletion and return its job ID immediately"""
+    try:
+        task = delete_vectors.delay(
+            request.vectorIds,
+            request.workspaceId
+        )
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/delete-vectors", response_model=DeleteVectorsResponse)
 async def handle_delete_vectors(request: DeleteVectorsRequest):
     """Delete vectors by their IDs, verifying workspace ownership"""
@@ -192,11 +654,76 @@ async def handle_delete_vectors(request: DeleteVectorsRequest):
             request.vectorIds,
             request.workspaceId
         )
-        result = task.get()  # Wait for the result
+        result = await run_in_threadpool(task.get)  # Wait without blocking the event loop
         return result
     except Exception as e:
         return DeleteVectorsResponse(
             success=False,
             deletedCount=0,
             error=str(e)
-        ) 
\ No newline at end of file
+        ) 
+
+@app.post("/admin/migrate-namespaces", response_model=JobResponse, status_code=202)
+async def handle_migrate_namespaces():
+    """Queue a job that moves shared-namespace vectors into per-workspace namespaces"""
+    try:
+        task = migrate_to_namespaces.delay()
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/reembed", response_model=JobResponse, status_code=202)
+async def handle_reembed(request: ReembedRequest):
+    """Queue a job that re-embeds every vector into a new index at a new dimension"""
+    try:
+        task = reembed_vectors.delay(request.target, request.dimensions)
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/rebuild-mirror", response_model=JobResponse, status_code=202)
+async def handle_rebuild_mirror():
+    """Queue a job that reloads the quantized local mirror from the vector store"""
+    try:
+        task = rebuild_mirror.delay()
+        return JobResponse(jobId=task.id, status="queued")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Report cache and request coalescing counters for this process"""
+    embedding_stats = {"enabled": False}
+    cache_stats = embedding_cache_stats()
+    if cache_stats is not None:
+        embedding_stats = {"enabled": True, **cache_stats}
+
+    return {
+        "embeddings": embedding_stats,
+        "answers": {"enabled": answer_cache.ANSWER_CACHE, **answer_cache.counters},
+        "singleFlight": {"enabled": singleflight.SINGLE_FLIGHT, **singleflight.stats()},
+        "messageWindow": {"enabled": message_window.MESSAGE_WINDOW, **message_window.counters}
+    }
+
+def metric_gauges():
+    """Cache, coalescing, scheduler and queue values sampled for /metrics"""
+    gauges = [
+        ("celery_queue_depth", {}, metrics.celery_queue_depth()),
+        ("log_records_dropped", {}, dropped_records()),
+        ("message_batch_dropped", {}, message_batcher.dropped)
+    ]
+    cache_stats = embedding_cache_stats()
+    if cache_stats is not None:
+        gauges += metrics.flatten_stats("embedding_cache", cache_stats)
+    gauges += metrics.flatten_stats("answer_cache", answer_cache.counters)
+    gauges += metrics.flatten_stats("single_flight", singleflight.stats())
+    gauges += metrics.flatten_stats("message_window", message_window.counters)
+    gauges += metrics.flatten_stats("openai_scheduler", scheduler.stats())
+    return gauges
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics for this API process and the Celery workers"""
+    # Reads Redis synchronously, so keep it off the event loop
+    body = await run_in_threadpool(lambda: metrics.render(metric_gauges()))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from .redis_client import get_redis, get_async_redis
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+MESSAGE_WINDOW = os.getenv('MESSAGE_WINDOW', 'true').lower() == 'true'
+
+# Recent messages kept per channel and per user; idle windows expire
+MESSAGE_WINDOW_SIZE = int(os.getenv('MESSAGE_WINDOW_SIZE', '20'))
+MESSAGE_WINDOW_TTL_SECONDS = int(os.getenv('MESSAGE_WINDOW_TTL_SECONDS', str(24 * 3600)))
+
+counters = {"hits": 0, "misses": 0, "errors": 0}
+
+def _channel_key(workspace_id: str, channel_id: str) -> str:
+    return f"recent:{workspace_id}:channel:{channel_id}"
+
+def _user_key(workspace_id: str, user_id: str) -> str:
+    return f"recent:{workspace_id}:user:{user_id}"
+
+async def record(message: Dict[str, Any]):
+    """Push a message onto its channel's and its author's ring buffers"""
+    if not MESSAGE_WINDOW:
+        return
+
+    entry = json.dumps({
+        "id": message["id"],
+        "content": message["content"],
+        "channelId": message["channelId"],
+        "userId": message["userId"],
+        "userName": message.get("userName"),
+        "createdAt": str(message.get("createdAt"))
+    })
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        for key in (
+            _channel_key(message["workspaceId"], message["channelId"]),
+            _user_key(message["workspaceId"], message["userId"])
+        ):
+            pipe.lpush(key, entry)
+            pipe.ltrim(key, 0, MESSAGE_WINDOW_SIZE - 1)
+            pipe.expire(key, MESSAGE_WINDOW_TTL_SECONDS)
+        await pipe.execute()
+    except Exception as e:
+        counters["errors"] += 1
+        logger.warning(f"Message window write failed: {str(e)}")
+
+def forget(workspace_id: str, deleted: Dict[str, Dict[str, Any]]):
+    """Drop deleted messages (vector ID to stored metadata) from the windows holding them"""
+    if not MESSAGE_WINDOW:
+        return
+
+    keys = set()
+    for metadata in deleted.values():
+        if metadata.get("channelId"):
+            keys.add(_channel_key(workspace_id, metadata["channelId"]))
+        if metadata.get("userId"):
+            keys.add(_user_key(workspace_id, metadata["userId"]))
+    if not keys:
+        return
+
+    try:
+        redis = get_redis()
+        keys = sorted(keys)
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.lrange(key, 0, -1)
+        windows = pipe.execute()
+
+        pipe = redis.pipeline(transaction=False)
+        for key, raw_entries in zip(keys, windows):
+            for raw in raw_entries:
+                if json.loads(raw)["id"] in deleted:
+                    pipe.lrem(key, 0, raw)
+        pipe.execute()
+    except Exception as e:
+        counters["errors"] += 1
+        logger.warning(f"Message window delete failed: {str(e)}")
+
+async def recent(
+    workspace_id: str,
+    user_id: str,
+    channel_id: Optional[str] = None,
+    limit: int = MESSAGE_WINDOW_SIZE
+) -> List[Tuple["Document", float]]:
+    """Newest messages of the channel (or of the user when no channel is given), newest first
+
+    Scores fall with age so the context packer keeps the most recent messages first.
+    """
+    if not MESSAGE_WINDOW:
+        return []
+
+    key = _channel_key(workspace_id, channel_id) if channel_id else _user_key(workspace_id, user_id)
+    try:
+        raw_entries = await get_async_redis().lrange(key, 0, limit - 1)
+    except Exception as e:
+        counters["errors"] += 1
+        logger.warning(f"Message window read failed: {str(e)}")
+        return []
+
+    counters["hits" if raw_entries else "misses"] += 1
+    from langchain_core.documents import Document
+
+    results = []
+    for rank, raw in enumerate(raw_entries):
+        entry = json.loads(raw)
+        metadata = {
+            "messageId": entry["id"],
+            "workspaceId": workspace_id,
+            "userId": entry["userId"],
+            "channelId": entry["channelId"],
+            "text": entry["content"]
+        }
+        results.append((
+            Document(id=entry["id"], page_content=entry["content"], metadata=metadata),
+            1.0 / (1 + rank)
+        ))
+    return results
@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Set
+
+# Metadata fields kept in an inverted index so equality filters skip the full scan
+INDEXED_FIELDS = ("workspaceId", "userId", "documentId", "channelId")
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a Pinecone-style metadata filter against one record"""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        for op, arg in condition.items():
+            if op == "$eq":
+                ok = value == arg
+            elif op == "$ne":
+                ok = value != arg
+            elif op == "$in":
+                ok = value in arg
+            elif op == "$nin":
+                ok = value not in arg
+            elif op == "$exists":
+                ok = (key in metadata) == arg
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                ok = {
+                    "$gt": value > arg,
+                    "$gte": value >= arg,
+                    "$lt": value < arg,
+                    "$lte": value <= arg,
+                }[op]
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            if not ok:
+                return False
+    return True
+
+def filter_candidates(
+    postings: Dict[tuple, Set[int]],
+    metadata: Dict[int, Dict[str, Any]],
+    filter: Dict[str, Any]
+) -> List[int]:
+    """Rows matching filter, narrowed through the postings of its equality conditions first"""
+    rows = None
+    for field in INDEXED_FIELDS:
+        condition = filter.get(field)
+        if isinstance(condition, dict):
+            condition = condition.get("$eq")
+        if condition is None or isinstance(condition, (dict, list)):
+            continue
+        posting = postings.get((field, condition), set())
+        rows = set(posting) if rows is None else rows & posting
+
+    if rows is None:
+        rows = metadata.keys()
+    return [row for row in rows if matches_filter(metadata[row], filter)]
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from .redis_client import get_redis
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+METRICS = os.getenv('METRICS', 'true').lower() == 'true'
+
+# Celery workers add their metrics to Redis hashes under this prefix after each task
+METRICS_REDIS_PREFIX = os.getenv('METRICS_REDIS_PREFIX', 'metrics')
+
+# Celery's default queue; its Redis list length is the backlog
+CELERY_QUEUE = os.getenv('CELERY_QUEUE', 'celery')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "rag_stage_seconds": "Time spent in one stage of a request or task",
+    "rag_http_request_seconds": "HTTP request latency by route",
+    "rag_task_seconds": "Celery task run time",
+    "rag_tokens_total": "Tokens sent to or received from OpenAI",
+    "rag_events_total": "Counted events such as cache hits and task outcomes",
+    "rag_gauge": "Point-in-time values sampled at scrape",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms"""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, labels: Labels):
+        with self._lock:
+            series = self.histograms.get((name, labels))
+            if series is None:
+                # One count per bucket, then +Inf, sum and count
+                series = self.histograms[(name, labels)] = [0.0] * (len(LATENCY_BUCKETS) + 3)
+            series[bisect_left(LATENCY_BUCKETS, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name: str, amount: float, labels: Labels):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0.0) + amount
+
+    def drain(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            histograms, counters = self.histograms, self.counters
+            self.histograms, self.counters = {}, {}
+        return histograms, counters
+
+    def snapshot(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            return {key: list(value) for key, value in self.histograms.items()}, dict(self.counters)
+
+registry = Registry()
+
+def observe(name: str, seconds: float, **labels):
+    if METRICS:
+        registry.observe(name, seconds, _labels(labels))
+
+def inc(name: str, amount: float = 1, **labels):
+    if METRICS and amount:
+        registry.inc(name, amount, _labels(labels))
+
+def event(name: str, amount: float = 1, **labels):
+    inc("rag_events_total", amount, event=name, **labels)
+
+def tokens(kind: str, amount: int, **labels):
+    inc("rag_tokens_total", amount, kind=kind, **labels)
+
+@contextmanager
+def stage(name: str, **labels) -> Iterator[None]:
+    """Time a block into rag_stage_seconds{stage=name}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("rag_stage_seconds", time.perf_counter() - started, stage=name, **labels)
+
+def timed_iter(iterable: Iterable, totals: Dict[str, float], key: str) -> Iterator:
+    """Yield from iterable, adding the time spent producing each item to totals[key]"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            totals[key] = totals.get(key, 0.0) + time.perf_counter() - started
+            return
+        totals[key] = totals.get(key, 0.0) + time.perf_counter() - started
+        yield item
+
+def flush_to_redis():
+    """Move this process's metrics into the shared Redis aggregate (Celery workers)"""
+    if not METRICS:
+        return
+    histograms, counters = registry.drain()
+    if not histograms and not counters:
+        return
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for (name, labels), series in histograms.items():
+            for i, value in enumerate(series):
+                if value:
+                    pipe.hincrbyfloat(f"{METRICS_REDIS_PREFIX}:histograms", json.dumps([name, labels, i]), value)
+        for (name, labels), value in counters.items():
+            pipe.hincrbyfloat(f"{METRICS_REDIS_PREFIX}:counters", json.dumps([name, labels]), value)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not flush worker metrics: {str(e)}")
+
+def _worker_snapshot() -> Tuple[Dict, Dict]:
+    redis = get_redis()
+    histograms: Dict[Tuple[str, Labels], List[float]] = {}
+    for field, value in redis.hgetall(f"{METRICS_REDIS_PREFIX}:histograms").items():
+        name, labels, i = json.loads(field)
+        key = (name, tuple(tuple(pair) for pair in labels))
+        histograms.setdefault(key, [0.0] * (len(LATENCY_BUCKETS) + 3))[i] = float(value)
+
+    counters = {}
+    for field, value in redis.hgetall(f"{METRICS_REDIS_PREFIX}:counters").items():
+        name, labels = json.loads(field)
+        counters[(name, tuple(tuple(pair) for pair in labels))] = float(value)
+    return histograms, counters
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render(gauges: Iterable[Tuple[str, Dict[str, object], float]] = ()) -> str:
+    """Prometheus text exposition of this process, the worker aggregate and sampled gauges"""
+    sources = [("api", registry.snapshot())]
+    try:
+        sources.append(("worker", _worker_snapshot()))
+    except Exception as e:
+        logger.warning(f"Could not read worker metrics: {str(e)}")
+
+    histograms: Dict[str, List[str]] = {}
+    counters: Dict[str, List[str]] = {}
+    for source, (source_histograms, source_counters) in sources:
+        for (name, labels), series in sorted(source_histograms.items()):
+            lines = histograms.setdefault(name, [])
+            cumulative = 0.0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), series[:-2]):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, {'source': source, 'le': str(bound)})} {_format_value(cumulative)}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels, {'source': source})} {_format_value(series[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels, {'source': source})} {_format_value(series[-1])}")
+        for (name, labels), value in sorted(source_counters.items()):
+            counters.setdefault(name, []).append(
+                f"{name}{_format_labels(labels, {'source': source})} {_format_value(value)}"
+            )
+
+    output = []
+    for name, lines in histograms.items():
+        output += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram", *lines]
+    for name, lines in counters.items():
+        output += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter", *lines]
+
+    gauge_lines = [
+        f"rag_gauge{_format_labels(_labels({'name': name, **labels}))} {_format_value(value)}"
+        for name, labels, value in gauges if value is not None
+    ]
+    if gauge_lines:
+        output += ["# HELP rag_gauge " + HELP["rag_gauge"], "# TYPE rag_gauge gauge", *gauge_lines]
+    return "\n".join(output) + "\n"
+
+def celery_queue_depth() -> Optional[int]:
+    try:
+        return get_redis().llen(CELERY_QUEUE)
+    except Exception as e:
+        logger.warning(f"Could not read Celery queue depth: {str(e)}")
+        return None
+
+def flatten_stats(prefix: str, stats: Dict[str, object]) -> List[Tuple[str, Dict[str, object], float]]:
+    """Numeric entries of a stats dict as gauges named prefix_key"""
+    return [
+        (f"{prefix}_{key}", {}, float(value))
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
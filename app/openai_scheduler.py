@@ -0,0 +1,398 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+import httpx
+from dotenv import load_dotenv
+from .redis_client import get_redis, get_async_redis
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Upper bound on concurrent OpenAI requests per process; the live limit adapts below it
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '32'))
+
+# Share of the org's request and token budget that bulk work leaves for interactive calls
+OPENAI_BULK_HEADROOM = float(os.getenv('OPENAI_BULK_HEADROOM', '0.2'))
+
+# Completion tokens assumed per chat request until the response headers say otherwise
+OPENAI_COMPLETION_TOKEN_ESTIMATE = int(os.getenv('OPENAI_COMPLETION_TOKEN_ESTIMATE', '300'))
+
+# Full-jitter exponential backoff for retried Celery tasks
+RETRY_BASE_SECONDS = float(os.getenv('RETRY_BASE_SECONDS', '2'))
+RETRY_MAX_SECONDS = float(os.getenv('RETRY_MAX_SECONDS', '300'))
+
+# Count of interactive calls waiting in any process; bulk calls hold back while it is above
+# zero. Waiters refresh its TTL, so a crashed process stops counting once it expires, and
+# bulk callers re-read it at most every INTERACTIVE_SIGNAL_POLL_SECONDS
+INTERACTIVE_WAITING_KEY = "openai:interactive_waiting"
+INTERACTIVE_SIGNAL_TTL_MS = int(os.getenv('INTERACTIVE_SIGNAL_TTL_MS', '1000'))
+INTERACTIVE_SIGNAL_POLL_SECONDS = float(os.getenv('INTERACTIVE_SIGNAL_POLL_SECONDS', '0.1'))
+
+_default_priority = INTERACTIVE
+
+_duration_part = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_unit_seconds = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds in an x-ratelimit-reset-* header such as "1s", "6m0s" or "20ms\""""
+    if not value:
+        return None
+    parts = _duration_part.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _unit_seconds[unit] for amount, unit in parts)
+
+def retry_after(headers: httpx.Headers) -> float:
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, ValueError):
+            continue
+    return 1.0
+
+def set_default_priority(priority: str):
+    """Priority for calls in this process that do not set one, e.g. BULK in Celery workers"""
+    global _default_priority
+    _default_priority = priority
+
+def current_priority() -> str:
+    return _default_priority
+
+class Bucket:
+    """Remaining requests or tokens in OpenAI's current rate-limit window, as last reported"""
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.remaining: Optional[float] = None
+        self.reset_at = 0.0
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str]):
+        if limit is None or remaining is None:
+            return
+        self.limit = float(limit)
+        self.remaining = float(remaining)
+        self.reset_at = time.monotonic() + (parse_reset(reset) or 60.0)
+
+    def refresh(self, now: float):
+        if self.limit is not None and now >= self.reset_at:
+            self.remaining = self.limit
+
+    def wait_for(self, cost: float, reserve: float, now: float) -> float:
+        """Seconds until cost fits with reserve left over, 0 if it fits now"""
+        if self.remaining is None:
+            return 0.0
+        # A request larger than the whole window is let through once the window is full
+        cost = min(cost, self.limit * (1 - reserve))
+        if self.remaining - cost >= reserve * self.limit:
+            return 0.0
+        return max(self.reset_at - now, 0.001)
+
+class Scheduler:
+    """Gate for every OpenAI HTTP request made by this process
+
+    Request and token buckets follow the x-ratelimit-* response headers, so they
+    reflect usage by every process sharing the API key. Interactive calls go
+    first: bulk calls wait while an interactive call is waiting in any process
+    (signalled through INTERACTIVE_WAITING_KEY), and only spend the budget above
+    OPENAI_BULK_HEADROOM. Concurrency adapts AIMD-style: it grows by one per
+    window of successes and halves on a 429.
+    """
+
+    def __init__(self, max_concurrency: int = OPENAI_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.requests = Bucket()
+        self.tokens = Bucket()
+        self.paused_until = 0.0
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self.counters = {"requests": 0, "rateLimited": 0, "waits": 0}
+        self._lock = threading.Lock()
+        # When this process last read the shared count of waiting interactive calls
+        self._checked_at = 0.0
+        self._waiting_elsewhere = False
+
+    def _publish_pipe(self, pipe, delta: int):
+        if delta:
+            pipe.incrby(INTERACTIVE_WAITING_KEY, delta)
+        pipe.pexpire(INTERACTIVE_WAITING_KEY, INTERACTIVE_SIGNAL_TTL_MS)
+
+    def _publish(self, delta: int):
+        """Add to (or just keep alive) the shared count of waiting interactive calls"""
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            self._publish_pipe(pipe, delta)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Interactive wait signal failed: {str(e)}")
+
+    async def _apublish(self, delta: int):
+        try:
+            pipe = get_async_redis().pipeline(transaction=False)
+            self._publish_pipe(pipe, delta)
+            await pipe.execute()
+        except Exception as e:
+            logger.debug(f"Interactive wait signal failed: {str(e)}")
+
+    def _check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < INTERACTIVE_SIGNAL_POLL_SECONDS:
+            return False
+        self._checked_at = now
+        return True
+
+    def _check(self):
+        try:
+            self._waiting_elsewhere = int(get_redis().get(INTERACTIVE_WAITING_KEY) or 0) > 0
+        except Exception as e:
+            self._waiting_elsewhere = False
+            logger.debug(f"Interactive wait signal check failed: {str(e)}")
+
+    async def _acheck(self):
+        try:
+            self._waiting_elsewhere = int(await get_async_redis().get(INTERACTIVE_WAITING_KEY) or 0) > 0
+        except Exception as e:
+            self._waiting_elsewhere = False
+            logger.debug(f"Interactive wait signal check failed: {str(e)}")
+
+    def _try_acquire(self, priority: str, cost: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refresh(now)
+            self.tokens.refresh(now)
+
+            wait = max(self.paused_until - now, 0.0)
+            reserve = OPENAI_BULK_HEADROOM if priority == BULK else 0.0
+            wait = max(wait, self.requests.wait_for(1, reserve, now), self.tokens.wait_for(cost, reserve, now))
+            if wait == 0.0 and self.in_flight >= int(self.concurrency_limit):
+                wait = 0.01
+            if wait == 0.0 and priority == BULK and (self.waiting[INTERACTIVE] or self._waiting_elsewhere):
+                wait = 0.01
+            if wait > 0.0:
+                return wait
+
+            self.in_flight += 1
+            self.counters["requests"] += 1
+            if self.requests.remaining is not None:
+                self.requests.remaining -= 1
+            if self.tokens.remaining is not None:
+                self.tokens.remaining -= cost
+            return 0.0
+
+    def _enter_wait(self, priority: str, waiting: bool):
+        with self._lock:
+            self.waiting[priority] += 1 if waiting else -1
+            if waiting:
+                self.counters["waits"] += 1
+
+    def acquire(self, priority: str, cost: float):
+        if priority == BULK and self._check_due():
+            self._check()
+        wait = self._try_acquire(priority, cost)
+        if not wait:
+            return
+        self._enter_wait(priority, True)
+        if priority == INTERACTIVE:
+            self._publish(1)
+        refreshed = time.monotonic()
+        try:
+            while wait:
+                time.sleep(min(wait, 0.05))
+                if priority == BULK and self._check_due():
+                    self._check()
+                elif priority == INTERACTIVE and time.monotonic() - refreshed > INTERACTIVE_SIGNAL_TTL_MS / 2000:
+                    self._publish(0)
+                    refreshed = time.monotonic()
+                wait = self._try_acquire(priority, cost)
+        finally:
+            self._enter_wait(priority, False)
+            if priority == INTERACTIVE:
+                self._publish(-1)
+
+    async def aacquire(self, priority: str, cost: float):
+        if priority == BULK and self._check_due():
+            await self._acheck()
+        wait = self._try_acquire(priority, cost)
+        if not wait:
+            return
+        self._enter_wait(priority, True)
+        if priority == INTERACTIVE:
+            await self._apublish(1)
+        refreshed = time.monotonic()
+        try:
+            while wait:
+                await asyncio.sleep(min(wait, 0.05))
+                if priority == BULK and self._check_due():
+                    await self._acheck()
+                elif priority == INTERACTIVE and time.monotonic() - refreshed > INTERACTIVE_SIGNAL_TTL_MS / 2000:
+                    await self._apublish(0)
+                    refreshed = time.monotonic()
+                wait = self._try_acquire(priority, cost)
+        finally:
+            self._enter_wait(priority, False)
+            if priority == INTERACTIVE:
+                await self._apublish(-1)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record(self, response: httpx.Response):
+        """Update buckets and the concurrency limit from a response's status and headers"""
+        with self._lock:
+            headers = response.headers
+            self.requests.update(
+                headers.get("x-ratelimit-limit-requests"),
+                headers.get("x-ratelimit-remaining-requests"),
+                headers.get("x-ratelimit-reset-requests")
+            )
+            self.tokens.update(
+                headers.get("x-ratelimit-limit-tokens"),
+                headers.get("x-ratelimit-remaining-tokens"),
+                headers.get("x-ratelimit-reset-tokens")
+            )
+
+            if response.status_code == 429:
+                self.counters["rateLimited"] += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after(headers))
+            elif response.status_code < 400:
+                self.concurrency_limit = min(
+                    float(self.max_concurrency), self.concurrency_limit + 1 / self.concurrency_limit
+                )
+
+    def pause_remaining(self) -> float:
+        with self._lock:
+            return max(self.paused_until - time.monotonic(), 0.0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "inFlight": self.in_flight,
+                "concurrencyLimit": round(self.concurrency_limit, 2),
+                "remainingRequests": self.requests.remaining,
+                "remainingTokens": self.tokens.remaining,
+                "waitingInteractive": self.waiting[INTERACTIVE],
+                "waitingBulk": self.waiting[BULK],
+                "interactiveWaitingElsewhere": int(self._waiting_elsewhere),
+                **self.counters
+            }
+
+scheduler = Scheduler()
+
+def estimate_tokens(request: httpx.Request) -> float:
+    """Rough token cost of a request, from its body size and expected completion"""
+    body = request.content or b""
+    cost = len(body) / 4
+    if request.url.path.endswith("/chat/completions"):
+        try:
+            cost += json.loads(body).get("max_tokens") or OPENAI_COMPLETION_TOKEN_ESTIMATE
+        except ValueError:
+            cost += OPENAI_COMPLETION_TOKEN_ESTIMATE
+    return cost
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+def _once(fn):
+    called = []
+    def wrapper():
+        if not called:
+            called.append(True)
+            fn()
+    return wrapper
+
+class ScheduledTransport(httpx.BaseTransport):
+    """Holds a scheduler slot from send until the response body is closed (covers streaming)"""
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler.acquire(current_priority(), estimate_tokens(request))
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            scheduler.release()
+            raise
+        scheduler.record(response)
+        release = _once(scheduler.release)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions
+        )
+
+    def close(self):
+        self._transport.close()
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await scheduler.aacquire(current_priority(), estimate_tokens(request))
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            scheduler.release()
+            raise
+        scheduler.record(response)
+        release = _once(scheduler.release)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncReleasingStream(response.stream, release),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def create_http_client() -> httpx.Client:
+    return httpx.Client(transport=ScheduledTransport(), timeout=httpx.Timeout(600.0, connect=5.0))
+
+def create_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=AsyncScheduledTransport(), timeout=httpx.Timeout(600.0, connect=5.0))
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, never shorter than a pause OpenAI asked for"""
+    ceiling = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt)
+    return max(random.uniform(0, ceiling), scheduler.pause_remaining())
@@ -1,14 +1,48 @@
 from celery import Celery
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from celery.signals import (
+    worker_init, worker_process_init, worker_process_shutdown,
+    before_task_publish, task_prerun, task_postrun
+)
 import os
 import httpx
 import tempfile
 import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from .embeddings import get_embeddings, create_embeddings, EMBEDDING_DIMENSIONS
+from .vectorstore import (
+    init_vector_store, close_vector_store, create_backend, get_mirror, list_namespaces,
+    upsert, fetch, list_ids, delete, PINECONE_FETCH_BATCH_SIZE, PINECONE_DELETE_BATCH_SIZE,
+    namespace_for, workspace_namespaces, MESSAGES, DOCUMENTS, VECTOR_PARTITIONING
+)
+from .jobs import update_bulk_job
+from .openai_scheduler import set_default_priority, backoff_delay, BULK
+from .answer_cache import invalidate_workspace
+from . import sparse_index, message_window
+from .sparse_index import HYBRID_RETRIEVAL
+from . import metrics
+from .metrics import stage, timed_iter
+from .tracing import get_trace_id, set_trace_id, reset_trace_id, new_trace_id
+from .logging_config import setup_logging, restart_after_fork
+
+logger = logging.getLogger('rag_service')
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Chunks embedded and upserted together, and batches allowed in flight per document
+DOCUMENT_BATCH_SIZE = int(os.getenv('DOCUMENT_BATCH_SIZE', '64'))
+DOCUMENT_MAX_IN_FLIGHT = int(os.getenv('DOCUMENT_MAX_IN_FLIGHT', '2'))
+
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Re-uploads only embed chunks whose content is not already indexed
+INCREMENTAL_REINDEX = os.getenv('INCREMENTAL_REINDEX', 'true').lower() == 'true'
 
 load_dotenv()
 
@@ -19,55 +53,302 @@ celery_app = Celery(
     backend=os.getenv('REDIS_URL')
 )
 
-embeddings = OpenAIEmbeddings(
-    openai_api_key=os.getenv('OPENAI_API_KEY'), 
-    model="text-embedding-3-large"
-)
+# Set in Celery workers, whose metrics go to Redis; tasks run in the API process keep theirs
+_in_worker = False
+
+def preload_modules():
+    """Import the heavy libraries behind lazily created clients and loaders"""
+    import langchain_core.documents  # noqa: F401
+    import langchain_core.prompts  # noqa: F401
+    import langchain_openai  # noqa: F401
+    import langchain.text_splitter  # noqa: F401
+    import langchain_community.document_loaders  # noqa: F401
+
+@worker_init.connect
+def init_worker(**kwargs):
+    global _in_worker
+    _in_worker = True
+    # Workers never import app.llm, which sets logging up in the API
+    setup_logging()
+    # Imported once in the parent so forked pool processes start with them loaded
+    preload_modules()
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # A log writer thread started before the fork did not survive it
+    setup_logging()
+    restart_after_fork()
+    init_vector_store()
+    get_embeddings()
+    # Ingestion yields to interactive API calls sharing the OpenAI rate limits
+    set_default_priority(BULK)
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    close_vector_store()
+
+@before_task_publish.connect
+def propagate_trace_id(headers=None, **kwargs):
+    # The API request's trace ID travels with the task message
+    trace_id = get_trace_id()
+    if headers is not None and trace_id:
+        headers["trace_id"] = trace_id
+
+_task_runs: Dict[str, Tuple[float, Any]] = {}
+
+@task_prerun.connect
+def start_task_trace(task_id=None, task=None, **kwargs):
+    trace_id = getattr(task.request, "trace_id", None) or new_trace_id()
+    _task_runs[task_id] = (time.perf_counter(), set_trace_id(trace_id))
+
+@task_postrun.connect
+def finish_task_trace(task_id=None, task=None, state=None, **kwargs):
+    run = _task_runs.pop(task_id, None)
+    if run is None:
+        return
+    started, token = run
+    metrics.observe("rag_task_seconds", time.perf_counter() - started, task=task.name, state=state)
+    reset_trace_id(token)
+    # Workers have no /metrics of their own; the API reads their totals from Redis
+    if _in_worker:
+        metrics.flush_to_redis()
+
+def message_metadata(message_data: dict) -> Dict[str, Any]:
+    return {
+        "messageId": message_data["id"],
+        "workspaceId": message_data["workspaceId"],
+        "userId": message_data["userId"],
+        "channelId": message_data["channelId"]
+    }
 
 @celery_app.task(bind=True, max_retries=3)
 def process_message(self, message_data: dict):
     try:
-        metadata = {
-            "messageId": message_data["id"],
-            "workspaceId": message_data["workspaceId"],
-            "userId": message_data["userId"],
-            "channelId": message_data["channelId"]
-        }
+        metadata = message_metadata(message_data)
         
-        # Create embedding and store in Pinecone
-        texts = [message_data["content"]]
-        vector_store = PineconeVectorStore.from_texts(
-            texts,
-            embeddings,
-            index_name=os.getenv('PINECONE_INDEX'),
-            metadatas=[metadata]
-        )
+        # Create embedding and store it, keyed by message ID so retries overwrite
+        metadata["text"] = message_data["content"]
+        with stage("embed", task="process_message"):
+            values = get_embeddings().embed_documents([message_data["content"]])[0]
+        with stage("upsert", task="process_message"):
+            upsert([{
+                "id": message_data["id"],
+                "values": values,
+                "metadata": metadata
+            }], namespace=namespace_for(message_data["workspaceId"], MESSAGES))
+        invalidate_workspace(message_data["workspaceId"])
         
         return {"status": "success", "messageId": message_data["id"]}
         
     except Exception as e:
-        self.retry(exc=e, countdown=60)  # Retry after 60 seconds
+        self.retry(exc=e, countdown=backoff_delay(self.request.retries))
+
+def index_message_batch(messages: List[dict]) -> List[Dict[str, Any]]:
+    """Embed and upsert a batch of messages, returning one result per message"""
+    results = []
+    vectors = []
+    texts = []
+
+    for message_data in messages:
+        try:
+            metadata = message_metadata(message_data)
+            metadata["text"] = message_data["content"]
+            vectors.append({"id": message_data["id"], "metadata": metadata})
+            texts.append(message_data["content"])
+            results.append({"messageId": message_data["id"], "status": "success"})
+        except Exception as e:
+            results.append({
+                "messageId": message_data.get("id"),
+                "status": "failed",
+                "error": str(e)
+            })
+
+    if vectors:
+        with stage("embed", task="process_message_batch"):
+            values_list = get_embeddings().embed_documents(texts)
+        for vector, values in zip(vectors, values_list):
+            vector["values"] = values
+
+        # A batch can span workspaces, and each may live in its own namespace
+        by_workspace = {}
+        for vector in vectors:
+            by_workspace.setdefault(vector["metadata"]["workspaceId"], []).append(vector)
+        for workspace_id, workspace_vectors in by_workspace.items():
+            with stage("upsert", task="process_message_batch"):
+                upsert(workspace_vectors, namespace=namespace_for(workspace_id, MESSAGES))
+            invalidate_workspace(workspace_id)
+
+    return results
+
+@celery_app.task(bind=True)
+def process_message_batch(self, messages: List[dict], job_id: Optional[str] = None):
+    try:
+        results = index_message_batch(messages)
+    except Exception as e:
+        # Hand each message back to the single-message task so retries stay per message
+        logger.error(f"Message batch of {len(messages)} failed, requeueing individually: {str(e)}")
+        for message_data in messages:
+            process_message.apply_async((message_data,), countdown=backoff_delay(0))
+        results = [
+            {"messageId": message_data.get("id"), "status": "requeued", "error": str(e)}
+            for message_data in messages
+        ]
 
-def download_file_sync(url: str, file_path: str):
+    if job_id:
+        indexed = sum(1 for r in results if r["status"] == "success")
+        update_bulk_job(job_id, batchesDone=1, indexed=indexed, failed=len(results) - indexed)
+
+    return {
+        "status": "success" if all(r["status"] == "success" for r in results) else "partial",
+        "results": results
+    }
+
+def download_file_sync(url: str, file_path: str) -> int:
+    """Stream the response body to disk and return the number of bytes written"""
+    downloaded = 0
     with httpx.Client() as client:
-        response = client.get(url)
-        response.raise_for_status()
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
+        with client.stream("GET", url) as response:
+            response.raise_for_status()
+            with open(file_path, 'wb') as f:
+                for data in response.iter_bytes(DOWNLOAD_CHUNK_BYTES):
+                    f.write(data)
+                    downloaded += len(data)
+    return downloaded
 
 def get_document_loader(file_path: str, file_type: str):
+    # Loaders and the text splitter are imported on first use, or up front by preload_modules
     if file_type == "application/pdf":
+        from langchain_community.document_loaders import PyPDFLoader
         return PyPDFLoader(file_path)
     else:
+        from langchain_community.document_loaders import TextLoader
         return TextLoader(file_path)
 
-def chunk_document(texts: List[str]) -> List[str]:
+def iter_chunks(texts: Iterable[str]) -> Iterator[str]:
+    """Chunk pages as they arrive, keeping overlap across page boundaries"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
         length_function=len,
     )
-    return text_splitter.split_text("\n\n".join(texts))
+
+    buffer = ""
+    for text in texts:
+        buffer = f"{buffer}\n\n{text}" if buffer else text
+        if len(buffer) < 2 * CHUNK_SIZE:
+            continue
+
+        # Hold back the last chunk; it already overlaps its predecessor and
+        # is re-split together with the next page
+        chunks = text_splitter.split_text(buffer)
+        yield from chunks[:-1]
+        buffer = chunks[-1] if chunks else ""
+
+    if buffer:
+        yield from text_splitter.split_text(buffer)
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def send_callback_sync(url: str, token: str, data: Dict[str, Any]):
+    with httpx.Client() as client:
+        try:
+            client.post(
+                url,
+                json=data,
+                headers={"x-callback-token": token},
+                timeout=10.0
+            )
+        except Exception as e:
+            logger.error(f"Callback failed: {str(e)}")
+
+def report_progress(task, stage: str, progress: Dict[str, Any]):
+    """Publish stage counters to the result backend for GET /jobs/{id}"""
+    if task.request.id and not task.request.is_eager:
+        task.update_state(state="PROGRESS", meta={"stage": stage, **progress})
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def existing_document_chunks(document_id: str, namespace: str = "") -> Dict[str, Dict[str, Any]]:
+    """Metadata of the chunks already indexed for a document, keyed by vector ID"""
+    existing = {}
+    for ids in iter_batches(list_ids(f"{document_id}_", namespace), PINECONE_FETCH_BATCH_SIZE):
+        for vid, vector in fetch(ids, namespace).items():
+            metadata = vector["metadata"]
+            # The prefix also matches chunks of documents such as "{document_id}_2"
+            if metadata.get("documentId") == document_id:
+                metadata.pop("text", None)
+                existing[vid] = metadata
+    return existing
+
+def plan_chunk_batch(
+    records: List[Dict[str, Any]],
+    existing: Dict[str, Dict[str, Any]],
+    reusable: Dict[str, set],
+    diff: Dict[str, int],
+    namespace: str = ""
+) -> List[Dict[str, Any]]:
+    """Drop unchanged chunks and attach stored vectors to chunks whose content is already indexed"""
+    to_write = []
+    reuse_sources = {}
+    overwritten = []
+
+    for record in records:
+        vid = record["id"]
+        metadata = record["metadata"]
+        old = existing.get(vid)
+
+        if old is not None and old.get("contentHash") == metadata["contentHash"]:
+            if all(old.get(key) == value for key, value in metadata.items() if key != "text"):
+                diff["unchanged"] += 1
+                continue
+            # Same content under new metadata, e.g. a renamed file
+            reuse_sources[vid] = vid
+        else:
+            if old is not None:
+                overwritten.append((old.get("contentHash"), vid))
+            sources = reusable.get(metadata["contentHash"])
+            if sources:
+                reuse_sources[vid] = next(iter(sources))
+        to_write.append(record)
+
+    # Fetch donors now, before this or any later batch can overwrite them
+    donors = fetch(sorted(set(reuse_sources.values())), namespace) if reuse_sources else {}
+
+    # Once this batch is written these IDs no longer hold their old content
+    for old_hash, vid in overwritten:
+        reusable.get(old_hash, set()).discard(vid)
+    for record in to_write:
+        donor = donors.get(reuse_sources.get(record["id"]))
+        if donor is not None:
+            record["values"] = donor["values"]
+            diff["reused"] += 1
+        else:
+            diff["added"] += 1
+
+    return to_write
+
+def embed_and_upsert(records: List[Dict[str, Any]], namespace: str = "") -> Tuple[int, int]:
+    """Embed records that have no vector yet and upsert the batch; returns (embedded, upserted)"""
+    pending = [record for record in records if "values" not in record]
+    if pending:
+        with stage("embed", task="process_document"):
+            vectors = get_embeddings().embed_documents([record["metadata"]["text"] for record in pending])
+        for record, values in zip(pending, vectors):
+            record["values"] = values
+    with stage("upsert", task="process_document"):
+        upserted = upsert(records, namespace)
+    return len(pending), upserted
 
 @celery_app.task(bind=True, max_retries=3)
 def process_document(
@@ -76,128 +357,212 @@ def process_document(
     workspace_id: str,
     file_url: str,
     file_name: str,
-    file_type: str
+    file_type: str,
+    callback_url: Optional[str] = None,
+    callback_token: Optional[str] = None
 ) -> Dict[str, Any]:
+    progress = {
+        "downloadedBytes": 0,
+        "pagesParsed": 0,
+        "chunks": 0,
+        "chunksEmbedded": 0,
+        "chunksUpserted": 0
+    }
+    fd, file_path = tempfile.mkstemp(suffix=os.path.splitext(file_name)[1])
+    os.close(fd)
+
     try:
-        # Create a temporary file to store the download
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file_name)[1]) as tmp_file:
-            # Download file
-            download_file_sync(file_url, tmp_file.name)
-            
-            # Load and process document
-            loader = get_document_loader(tmp_file.name, file_type)
-            documents = loader.load()
-            
-            # Extract text content
-            texts = [doc.page_content for doc in documents]
-            
-            # Chunk the document
-            chunks = chunk_document(texts)
-            
-            # Generate vector IDs
-            vector_ids = [f"{document_id}_{i}" for i in range(len(chunks))]
-            
-            # Prepare metadata for each chunk
-            metadatas = [{
-                "documentId": document_id,
-                "workspaceId": workspace_id,
-                "fileName": file_name,
-                "chunkIndex": i
-            } for i in range(len(chunks))]
-            
-            # Store in vector database with explicit IDs
-            vector_store = PineconeVectorStore.from_texts(
-                chunks,
-                embeddings,
-                index_name=os.getenv('PINECONE_INDEX'),
-                metadatas=metadatas,
-                ids=vector_ids
-            )
-            
-            # Cleanup temporary file
-            os.unlink(tmp_file.name)
-            
-            return {
-                "success": True,
-                "documentId": document_id,
-                "chunks": len(chunks),
-                "vectorIds": vector_ids
-            }
-            
+        report_progress(self, "downloading", progress)
+        with stage("download", task="process_document"):
+            progress["downloadedBytes"] = download_file_sync(file_url, file_path)
+        report_progress(self, "processing", progress)
+
+        def iter_pages():
+            for page in get_document_loader(file_path, file_type).lazy_load():
+                progress["pagesParsed"] += 1
+                yield page.page_content
+
+        namespace = namespace_for(workspace_id, DOCUMENTS)
+        existing = {}
+        if INCREMENTAL_REINDEX:
+            try:
+                existing = existing_document_chunks(document_id, namespace)
+            except Exception as e:
+                logger.warning(f"Could not list existing chunks of {document_id}, reindexing in full: {str(e)}")
+
+        reusable = {}
+        for vid, metadata in existing.items():
+            reusable.setdefault(metadata.get("contentHash"), set()).add(vid)
+
+        diff = {"added": 0, "unchanged": 0, "reused": 0, "removed": 0}
+        vector_ids = []
+        in_flight = deque()
+        # Parsing and chunking are interleaved generators, so time them per item
+        timings: Dict[str, float] = {}
+
+        def complete_oldest():
+            embedded, upserted = in_flight.popleft().result()
+            progress["chunksEmbedded"] += embedded
+            progress["chunksUpserted"] += upserted
+            report_progress(self, "processing", progress)
+
+        # Embedding and upserting batch N overlaps parsing and chunking batch N+1;
+        # at most DOCUMENT_MAX_IN_FLIGHT batches are held in memory at once
+        with ThreadPoolExecutor(max_workers=DOCUMENT_MAX_IN_FLIGHT) as executor:
+            pages = timed_iter(iter_pages(), timings, "parse")
+            chunk_stream = timed_iter(iter_chunks(pages), timings, "parse_and_chunk")
+            for chunks in iter_batches(chunk_stream, DOCUMENT_BATCH_SIZE):
+                start = len(vector_ids)
+                records = [{
+                    "id": f"{document_id}_{i}",
+                    "metadata": {
+                        "documentId": document_id,
+                        "workspaceId": workspace_id,
+                        "fileName": file_name,
+                        "chunkIndex": i,
+                        "contentHash": content_hash(chunk),
+                        "text": chunk
+                    }
+                } for i, chunk in enumerate(chunks, start)]
+                vector_ids.extend(record["id"] for record in records)
+                progress["chunks"] = len(vector_ids)
+
+                if HYBRID_RETRIEVAL:
+                    sparse_index.index_chunks(workspace_id, records)
+
+                records = plan_chunk_batch(records, existing, reusable, diff, namespace)
+                if not records:
+                    continue
+
+                if len(in_flight) >= DOCUMENT_MAX_IN_FLIGHT:
+                    complete_oldest()
+                in_flight.append(executor.submit(embed_and_upsert, records, namespace))
+
+            while in_flight:
+                complete_oldest()
+
+        metrics.observe("rag_stage_seconds", timings.get("parse", 0.0), stage="parse", task="process_document")
+        metrics.observe(
+            "rag_stage_seconds",
+            timings.get("parse_and_chunk", 0.0) - timings.get("parse", 0.0),
+            stage="chunk",
+            task="process_document"
+        )
+        metrics.event("chunks_embedded", progress["chunksEmbedded"], task="process_document")
+
+        # Chunks past the new end of the document are stale
+        current_ids = set(vector_ids)
+        stale_ids = [vid for vid in existing if vid not in current_ids]
+        diff["removed"] = delete(stale_ids, namespace)
+        if HYBRID_RETRIEVAL:
+            sparse_index.delete_chunks(workspace_id, stale_ids)
+        invalidate_workspace(workspace_id)
+
+        result = {
+            "success": True,
+            "documentId": document_id,
+            "chunks": len(vector_ids),
+            "vectorIds": vector_ids,
+            "diff": diff
+        }
+
     except Exception as e:
-        return {
+        result = {
             "success": False,
             "documentId": document_id,
             "error": str(e)
         }
 
-# def send_callback_sync(url: str, token: str, data: Dict[str, Any]):
-#     with httpx.Client() as client:
-#         try:
-#             client.post(
-#                 url,
-#                 json=data,
-#                 headers={"x-callback-token": token},
-#                 timeout=10.0
-#             )
-#         except Exception as e:
-#             print(f"Callback failed: {str(e)}")
-
-# @celery_app.task(bind=True, max_retries=3)
-# def delete_document(
-#     self,
-#     document_id: str,
-#     workspace_id: str,
-#     callback_url: Optional[str] = None,
-#     callback_token: Optional[str] = None
-# ) -> Dict[str, Any]:
-#     try:
-#         # Initialize vector store
-#         vector_store = PineconeVectorStore.from_existing_index(
-#             index_name=os.getenv('PINECONE_INDEX'),
-#             embedding=embeddings
-#         )
-#         
-#         # Delete all chunks for this document
-#         vector_store.delete(
-#             filter={
-#                 "$and": [
-#                     {"document_id": {"$eq": document_id}},
-#                     {"workspace_id": {"$eq": workspace_id}}
-#                 ]
-#             }
-#         )
-#         
-#         result = {
-#             "success": True
-#         }
-#         
-#         # Send callback if URL provided
-#         if callback_url and callback_token:
-#             callback_data = {
-#                 "documentId": document_id,
-#                 "status": "DELETED"
-#             }
-#             send_callback_sync(callback_url, callback_token, callback_data)
-#         
-#         return result
-#         
-#     except Exception as e:
-#         error_result = {
-#             "success": False,
-#             "error": str(e)
-#         }
-#         
-#         # Send error callback if URL provided
-#         if callback_url and callback_token:
-#             callback_data = {
-#                 "documentId": document_id,
-#                 "status": "FAILED",
-#                 "error": str(e)
-#             }
-#             send_callback_sync(callback_url, callback_token, callback_data)
-#         
-#         return error_result
+    finally:
+        os.unlink(file_path)
+
+    if callback_url and callback_token:
+        callback_data = {
+            "documentId": document_id,
+            "status": "PROCESSED" if result["success"] else "FAILED",
+            "chunks": result.get("chunks"),
+            "error": result.get("error")
+        }
+        send_callback_sync(callback_url, callback_token, callback_data)
+
+    return result
+
+def delete_owned(
+    vector_ids: List[str],
+    workspace_id: str,
+    namespace: str,
+    document_id: Optional[str] = None
+) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """Delete the IDs that exist in the namespace and belong to the workspace (and document)
+
+    Ownership is read from stored metadata by ID fetch, so no embedding or ANN query
+    is needed. Returns (metadata of the deleted IDs, IDs found but owned by someone else).
+    """
+    deleted = {}
+    not_owned = []
+    for ids in iter_batches(vector_ids, PINECONE_FETCH_BATCH_SIZE):
+        owned = {}
+        for vid, vector in fetch(ids, namespace).items():
+            metadata = vector["metadata"]
+            if metadata.get("workspaceId") != workspace_id:
+                not_owned.append(vid)
+            elif document_id is not None and metadata.get("documentId") != document_id:
+                # The ID prefix also matches chunks of documents such as "{document_id}_2"
+                continue
+            else:
+                owned[vid] = metadata
+        delete(list(owned), namespace)
+        deleted.update(owned)
+    return deleted, not_owned
+
+@celery_app.task(bind=True, max_retries=3)
+def delete_document(
+    self,
+    document_id: str,
+    workspace_id: str,
+    callback_url: Optional[str] = None,
+    callback_token: Optional[str] = None
+) -> Dict[str, Any]:
+    try:
+        namespace = namespace_for(workspace_id, DOCUMENTS)
+        deleted_count = 0
+
+        # Enumerate the document's chunks by ID prefix, a page at a time
+        for ids in iter_batches(list_ids(f"{document_id}_", namespace), PINECONE_DELETE_BATCH_SIZE):
+            deleted, _ = delete_owned(ids, workspace_id, namespace, document_id)
+            deleted_count += len(deleted)
+            report_progress(self, "deleting", {"deletedCount": deleted_count})
+
+        if HYBRID_RETRIEVAL:
+            sparse_index.delete_document_chunks(workspace_id, document_id)
+        if deleted_count:
+            invalidate_workspace(workspace_id)
+
+        result = {
+            "success": True,
+            "documentId": document_id,
+            "deletedCount": deleted_count
+        }
+
+    except Exception as e:
+        result = {
+            "success": False,
+            "documentId": document_id,
+            "deletedCount": 0,
+            "error": str(e)
+        }
+
+    # Send callback if URL provided
+    if callback_url and callback_token:
+        callback_data = {
+            "documentId": document_id,
+            "status": "DELETED" if result["success"] else "FAILED",
+            "deletedCount": result["deletedCount"],
+            "error": result.get("error")
+        }
+        send_callback_sync(callback_url, callback_token, callback_data)
+
+    return result
 
 @celery_app.task(bind=True, max_retries=3)
 def delete_vectors(
@@ -206,35 +571,40 @@ def delete_vectors(
     workspace_id: str
 ) -> Dict[str, Any]:
     try:
-        # Initialize vector store
-        vector_store = PineconeVectorStore.from_existing_index(
-            index_name=os.getenv('PINECONE_INDEX'),
-            embedding=embeddings
-        )
-        
-        # First verify these vectors belong to the workspace
-        results = vector_store.similarity_search(
-            query="",  # Dummy query
-            k=1,
-            filter={
-                "workspaceId": workspace_id,
-                "documentId": {"$in": [vid.split('_')[0] for vid in vector_ids]}  # Extract document IDs
-            }
-        )
-        
-        if not results:
+        remaining = list(dict.fromkeys(vector_ids))
+        deleted_ids = {}
+        not_owned_count = 0
+
+        # IDs can live in either of the workspace's partitions
+        for namespace in workspace_namespaces(workspace_id):
+            if not remaining:
+                break
+            deleted, not_owned = delete_owned(remaining, workspace_id, namespace)
+            deleted_ids.update(deleted)
+            not_owned_count += len(not_owned)
+            handled = set(deleted) | set(not_owned)
+            remaining = [vid for vid in remaining if vid not in handled]
+
+        deleted_count = len(deleted_ids)
+        if not deleted_count:
             return {
                 "success": False,
                 "deletedCount": 0,
+                "notOwnedCount": not_owned_count,
+                "notFoundCount": len(remaining),
                 "error": "No matching vectors found in workspace"
             }
-        
-        # Delete vectors by their IDs
-        vector_store.delete(ids=vector_ids)
+
+        if HYBRID_RETRIEVAL:
+            sparse_index.delete_chunks(workspace_id, list(deleted_ids))
+        message_window.forget(workspace_id, deleted_ids)
+        invalidate_workspace(workspace_id)
         
         return {
             "success": True,
-            "deletedCount": len(vector_ids)
+            "deletedCount": deleted_count,
+            "notOwnedCount": not_owned_count,
+            "notFoundCount": len(remaining)
         }
         
     except Exception as e:
@@ -243,3 +613,112 @@ def delete_vectors(
             "deletedCount": 0,
             "error": str(e)
         }
+
+@celery_app.task(bind=True)
+def migrate_to_namespaces(
+    self,
+    source_namespace: str = "",
+    batch_size: int = PINECONE_FETCH_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Re-home vectors from a shared namespace into per-workspace partitions"""
+    if VECTOR_PARTITIONING != "namespace":
+        return {"success": False, "error": "VECTOR_PARTITIONING is not set to 'namespace'"}
+
+    progress = {"scanned": 0, "moved": 0, "skipped": 0}
+    try:
+        for ids in iter_batches(list_ids("", source_namespace), batch_size):
+            targets = {}
+            for vector in fetch(ids, source_namespace).values():
+                workspace_id = vector["metadata"].get("workspaceId")
+                if not workspace_id:
+                    progress["skipped"] += 1
+                    continue
+                kind = DOCUMENTS if "documentId" in vector["metadata"] else MESSAGES
+                targets.setdefault(namespace_for(workspace_id, kind), []).append(vector)
+
+            moved_ids = []
+            for namespace, vectors in targets.items():
+                upsert(vectors, namespace)
+                moved_ids.extend(vector["id"] for vector in vectors)
+
+            # Only drop the originals once their copies are written
+            delete(moved_ids, source_namespace)
+
+            progress["scanned"] += len(ids)
+            progress["moved"] += len(moved_ids)
+            report_progress(self, "migrating", progress)
+
+        return {"success": True, **progress}
+
+    except Exception as e:
+        return {"success": False, "error": str(e), **progress}
+
+@celery_app.task(bind=True)
+def reembed_vectors(
+    self,
+    target: str,
+    dimensions: Optional[int] = EMBEDDING_DIMENSIONS,
+    batch_size: int = PINECONE_FETCH_BATCH_SIZE
+) -> Dict[str, Any]:
+    """Copy every vector into target, re-embedded from its stored text at the given size
+
+    target is a Pinecone index (created beforehand with the new dimension) or, with the
+    FAISS backend, a directory. Point PINECONE_HOST/FAISS_INDEX_DIR and EMBEDDING_DIMENSIONS
+    at the new index once the job completes.
+    """
+    progress = {"scanned": 0, "reembedded": 0, "skipped": 0}
+    target_backend = create_backend(target)
+    target_embeddings = create_embeddings(dimensions)
+    try:
+        for namespace in list_namespaces():
+            for ids in iter_batches(list_ids("", namespace), batch_size):
+                vectors = [
+                    vector for vector in fetch(ids, namespace).values()
+                    if vector["metadata"].get("text")
+                ]
+                texts = [vector["metadata"]["text"] for vector in vectors]
+                values = target_embeddings.embed_documents(texts) if texts else []
+                target_backend.upsert([{
+                    "id": vector["id"],
+                    "values": vector_values,
+                    "metadata": vector["metadata"]
+                } for vector, vector_values in zip(vectors, values)], namespace)
+
+                progress["scanned"] += len(ids)
+                progress["reembedded"] += len(vectors)
+                progress["skipped"] += len(ids) - len(vectors)
+                report_progress(self, "reembedding", progress)
+
+        return {"success": True, "target": target, "dimensions": dimensions, **progress}
+
+    except Exception as e:
+        return {"success": False, "error": str(e), **progress}
+
+    finally:
+        target_backend.close()
+
+@celery_app.task(bind=True)
+def rebuild_mirror(self, batch_size: int = PINECONE_FETCH_BATCH_SIZE) -> Dict[str, Any]:
+    """Reload the quantized local mirror from the vector store"""
+    mirror = get_mirror()
+    if mirror is None:
+        return {"success": False, "error": "VECTOR_MIRROR is off"}
+
+    progress = {"namespaces": 0, "mirrored": 0}
+    try:
+        for namespace in list_namespaces():
+            mirror.reset(namespace)
+            for ids in iter_batches(list_ids("", namespace), batch_size):
+                vectors = list(fetch(ids, namespace).values())
+                if vectors and not mirror.upsert(vectors, namespace):
+                    raise RuntimeError(f"Could not mirror namespace {namespace!r}")
+                progress["mirrored"] += len(vectors)
+                report_progress(self, "mirroring", progress)
+            # Only now may queries for this namespace be served from the mirror
+            mirror.mark_complete(namespace)
+            progress["namespaces"] += 1
+
+        return {"success": True, **progress}
+
+    except Exception as e:
+        return {"success": False, "error": str(e), **progress}
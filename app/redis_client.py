@@ -0,0 +1,46 @@
+import os
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# A Redis that hangs instead of refusing connections must not hang the requests using it
+REDIS_CONNECT_TIMEOUT_SECONDS = float(os.getenv('REDIS_CONNECT_TIMEOUT_SECONDS', '1'))
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv('REDIS_SOCKET_TIMEOUT_SECONDS', '2'))
+
+def _timeouts():
+    return {
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT_SECONDS,
+        "socket_timeout": REDIS_SOCKET_TIMEOUT_SECONDS,
+    }
+
+_pid: Optional[int] = None
+_client: Optional[redis.Redis] = None
+
+def get_redis() -> redis.Redis:
+    """Process-wide client for the Redis instance Celery already uses"""
+    global _pid, _client
+
+    if _client is None or _pid != os.getpid():
+        _client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), **_timeouts())
+        _pid = os.getpid()
+    return _client
+
+_async_client: Optional[aioredis.Redis] = None
+
+def get_async_redis() -> aioredis.Redis:
+    """Client for use on the API event loop"""
+    global _async_client
+
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), **_timeouts())
+    return _async_client
+
+async def aclose_async_redis():
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
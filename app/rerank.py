@@ -0,0 +1,78 @@
+import html
+import os
+import re
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Candidates fetched per requested result, so duplicates can be skipped without losing k
+RERANK_OVERFETCH = int(os.getenv('RERANK_OVERFETCH', '3'))
+
+# 1.0 ranks by relevance only; lower values favour results unlike those already picked
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', '0.7'))
+
+# Candidates at least this similar to an already picked result are dropped as duplicates
+DUPLICATE_THRESHOLD = float(os.getenv('DUPLICATE_THRESHOLD', '0.95'))
+
+TAG = re.compile(r"<[^>]+>")
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_fragment(text: str) -> str:
+    """Strip HTML tags and entities so "bts!</p><p>" and "bts!" compare equal"""
+    text = html.unescape(TAG.sub(" ", text))
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+def _unit_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def mmr_select(
+    query_vector: List[float],
+    candidate_vectors: List[List[float]],
+    texts: List[str],
+    k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    duplicate_threshold: float = DUPLICATE_THRESHOLD
+) -> List[int]:
+    """Pick up to k candidate indices by maximal marginal relevance, skipping near-duplicates
+
+    Candidates whose normalized text repeats an earlier (better scored) one are
+    removed first; the rest are compared by cosine similarity of their vectors.
+    """
+    if not candidate_vectors or k <= 0:
+        return []
+
+    seen = set()
+    unique = []
+    for i, text in enumerate(texts):
+        key = normalize_fragment(text)
+        if key not in seen:
+            seen.add(key)
+            unique.append(i)
+
+    candidates = _unit_rows([candidate_vectors[i] for i in unique])
+    relevance = candidates @ _unit_rows(query_vector)
+    pairwise = candidates @ candidates.T
+
+    selected: List[int] = []
+    # Highest similarity of each candidate to anything selected so far
+    redundancy = np.full(len(unique), -np.inf, dtype=np.float32)
+    available = np.ones(len(unique), dtype=bool)
+
+    while len(selected) < k and available.any():
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        available &= redundancy < duplicate_threshold
+
+    return [unique[i] for i in selected]
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from .embeddings import get_embeddings
+from .vectorstore import aquery
+from .rerank import mmr_select, RERANK_OVERFETCH
+from . import sparse_index
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Upper bound on searches one worker keeps in flight at the same time
+RETRIEVAL_CONCURRENCY = int(os.getenv('RETRIEVAL_CONCURRENCY', '256'))
+
+# Diversify results with MMR and drop near-duplicates before they reach the caller; this
+# over-fetches candidates with their vectors, so it costs latency and is off by default
+RETRIEVAL_RERANK = os.getenv('RETRIEVAL_RERANK', 'false').lower() == 'true'
+
+# Reciprocal rank fusion constant; larger values flatten the gap between top ranks
+RRF_K = int(os.getenv('RRF_K', '60'))
+
+TEXT_KEY = "text"
+
+_semaphore = asyncio.Semaphore(RETRIEVAL_CONCURRENCY)
+
+def match_to_document(match: Dict[str, Any]) -> Optional["Document"]:
+    # langchain_core is imported on the first search rather than at startup
+    from langchain_core.documents import Document
+
+    metadata = dict(match.get("metadata") or {})
+    if TEXT_KEY not in metadata:
+        logger.warning(f"Found document with no `{TEXT_KEY}` key. Skipping.")
+        return None
+    text = metadata.pop(TEXT_KEY)
+    return Document(id=match["id"], page_content=text, metadata=metadata)
+
+async def aembed_query(query: str) -> List[float]:
+    async with _semaphore:
+        return await get_embeddings().aembed_query(query)
+
+async def aembed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed several queries with one request"""
+    embeddings = get_embeddings()
+    # Only the cached wrapper tells queries apart from documents
+    aembed = getattr(embeddings, "aembed_queries", embeddings.aembed_documents)
+    async with _semaphore:
+        return await aembed(queries)
+
+async def asimilarity_search_by_vector_with_score(
+    vector: List[float],
+    k: int,
+    filter: Optional[Dict[str, Any]] = None,
+    namespace: str = ""
+) -> List[Tuple["Document", float]]:
+    """Search the index, over-fetching and re-ranking with MMR when enabled"""
+    rerank = RETRIEVAL_RERANK and k > 0
+    async with _semaphore:
+        matches = await aquery(
+            vector,
+            top_k=k * RERANK_OVERFETCH if rerank else k,
+            filter=filter,
+            include_values=rerank,
+            namespace=namespace
+        )
+
+    results = []
+    values = []
+    for match in matches:
+        doc = match_to_document(match)
+        if doc is not None:
+            results.append((doc, match["score"]))
+            values.append(match.get("values"))
+
+    if rerank and results:
+        # Scoring hundreds of full-size vectors would stall the event loop
+        picked = await asyncio.to_thread(mmr_select, vector, values, [doc.page_content for doc, score in results], k)
+        results = [results[i] for i in picked]
+    return results
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Tuple["Document", float]]],
+    k: int
+) -> List[Tuple["Document", float]]:
+    """Merge ranked lists by summing 1 / (RRF_K + rank), keeping the first copy of each document"""
+    fused: Dict[str, float] = {}
+    documents: Dict[str, "Document"] = {}
+    for ranking in rankings:
+        for rank, (doc, score) in enumerate(ranking, 1):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1.0 / (RRF_K + rank)
+            documents.setdefault(doc.id, doc)
+
+    best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(documents[vid], score) for vid, score in best]
+
+async def ahybrid_search_with_score(
+    query: str,
+    vector: List[float],
+    workspace_id: str,
+    k: int,
+    filter: Optional[Dict[str, Any]] = None,
+    namespace: str = ""
+) -> List[Tuple["Document", float]]:
+    """Fuse dense results with the workspace's BM25 results"""
+    from langchain_core.documents import Document
+
+    dense, sparse = await asyncio.gather(
+        asimilarity_search_by_vector_with_score(vector, k, filter, namespace),
+        sparse_index.asearch(workspace_id, query, k * RERANK_OVERFETCH)
+    )
+    sparse_results = [
+        (Document(id=vid, page_content=text, metadata=metadata), score)
+        for vid, text, metadata, score in sparse
+    ]
+    return reciprocal_rank_fusion([dense, sparse_results], k)
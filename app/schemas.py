@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Literal
 
 class MessageEvent(BaseModel):
     id: str
@@ -12,17 +12,38 @@ class MessageEvent(BaseModel):
     channelName: str
     createdAt: datetime
 
+class BulkJobStatus(BaseModel):
+    jobId: str
+    status: str
+    received: int
+    invalid: int
+    batchesQueued: int
+    batchesDone: int
+    indexed: int
+    failed: int
+    elapsedSeconds: float
+    messagesPerSecond: float
+    error: Optional[str] = None
+
 class SearchQuery(BaseModel):
     query: str
     workspaceId: str
     receiverId: str
     limit: int = 5
 
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery]
+
 class GenerateRequest(BaseModel):
     query: str
     workspaceId: str
     receiverId: str
     limit: int = 5
+    # Conversation the reply is for; its recent messages are the "window"
+    channelId: Optional[str] = None
+    # vector: similarity search only; window: recent messages, searching only when there are
+    # fewer than limit of them; merge: both, fused by rank
+    contextMode: Literal["vector", "window", "merge"] = "vector"
 
 class SearchResult(BaseModel):
     content: str
@@ -30,10 +51,19 @@ class SearchResult(BaseModel):
     documentId: Optional[str] = None
     documentName: Optional[str] = None
 
+class BatchSearchItem(BaseModel):
+    messages: List[SearchResult] = []
+    error: Optional[str] = None
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchItem]
+
 class AIResponse(BaseModel):
     response: str
     confidence: float
     sourceMessages: List[SearchResult]
+    cached: bool = False
+    contextTokens: Optional[int] = None
 
 class ProcessDocumentRequest(BaseModel):
     documentId: str
@@ -41,12 +71,21 @@ class ProcessDocumentRequest(BaseModel):
     fileUrl: str
     fileName: str
     fileType: str
+    callbackUrl: Optional[str] = None
+    callbackToken: Optional[str] = None
+
+class IndexDiff(BaseModel):
+    added: int
+    unchanged: int
+    reused: int
+    removed: int
 
 class ProcessDocumentResponse(BaseModel):
     success: bool
     documentId: str
     chunks: Optional[int] = None
     vectorIds: Optional[List[str]] = None
+    diff: Optional[IndexDiff] = None
     error: Optional[str] = None
 
 class KnowledgeBaseRequest(BaseModel):
@@ -61,4 +100,34 @@ class DeleteVectorsRequest(BaseModel):
 class DeleteVectorsResponse(BaseModel):
     success: bool
     deletedCount: int
-    error: Optional[str] = None
\ No newline at end of file
+    notOwnedCount: Optional[int] = None
+    notFoundCount: Optional[int] = None
+    error: Optional[str] = None
+
+class DeleteDocumentRequest(BaseModel):
+    documentId: str
+    workspaceId: str
+    callbackUrl: Optional[str] = None
+    callbackToken: Optional[str] = None
+
+class DeleteDocumentResponse(BaseModel):
+    success: bool
+    documentId: Optional[str] = None
+    deletedCount: int = 0
+    error: Optional[str] = None
+
+class JobResponse(BaseModel):
+    jobId: str
+    status: str
+
+class JobStatus(BaseModel):
+    jobId: str
+    status: str
+    stage: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class ReembedRequest(BaseModel):
+    target: str
+    dimensions: Optional[int] = None
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+from .redis_client import get_async_redis
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Share one in-flight computation between identical concurrent requests in this process
+SINGLE_FLIGHT = os.getenv('SINGLE_FLIGHT', 'true').lower() == 'true'
+
+# Also elect one leader across API workers through Redis; followers poll for its result
+SINGLE_FLIGHT_REDIS = os.getenv('SINGLE_FLIGHT_REDIS', 'false').lower() == 'true'
+
+# Leader lease; a follower runs the request itself if no result appears within the wait
+SINGLE_FLIGHT_LOCK_SECONDS = int(os.getenv('SINGLE_FLIGHT_LOCK_SECONDS', '30'))
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', '30'))
+
+# Long enough for followers to pick the result up, short enough not to act as a cache
+SINGLE_FLIGHT_RESULT_TTL_SECONDS = int(os.getenv('SINGLE_FLIGHT_RESULT_TTL_SECONDS', '5'))
+
+counters = {"leaders": 0, "coalesced": 0, "remoteCoalesced": 0, "remoteFallbacks": 0, "redisErrors": 0}
+
+_in_flight: Dict[str, asyncio.Future] = {}
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+async def _wait_for_leader(redis, key: str) -> Any:
+    """Poll for the remote leader's result; None if it finishes without one or the wait expires"""
+    token = await redis.get(f"singleflight:lock:{key}")
+    if token is None:
+        return None
+
+    # Results are keyed by the leader's token so an earlier flight's result is never reused
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT_SECONDS
+    delay = 0.01
+    while time.monotonic() < deadline:
+        raw, leader = await asyncio.gather(
+            redis.get(f"singleflight:result:{key}:{token.decode()}"),
+            redis.get(f"singleflight:lock:{key}")
+        )
+        if raw is not None:
+            return json.loads(raw)
+        if leader != token:
+            # Recheck once: the leader may have published and released between the two reads
+            raw = await redis.get(f"singleflight:result:{key}:{token.decode()}")
+            return json.loads(raw) if raw is not None else None
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    return None
+
+async def _run_shared(key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    if not SINGLE_FLIGHT_REDIS:
+        return await fn()
+
+    try:
+        redis = get_async_redis()
+        token = uuid.uuid4().hex
+        leader = await redis.set(f"singleflight:lock:{key}", token, nx=True, ex=SINGLE_FLIGHT_LOCK_SECONDS)
+        if not leader:
+            result = await _wait_for_leader(redis, key)
+            if result is not None:
+                counters["remoteCoalesced"] += 1
+                return result
+            counters["remoteFallbacks"] += 1
+            return await fn()
+    except Exception as e:
+        counters["redisErrors"] += 1
+        logger.warning(f"Single-flight coordination failed: {str(e)}")
+        return await fn()
+
+    try:
+        result = await fn()
+        try:
+            await redis.set(
+                f"singleflight:result:{key}:{token}", json.dumps(result), ex=SINGLE_FLIGHT_RESULT_TTL_SECONDS
+            )
+        except Exception as e:
+            # Followers fall back to running the request themselves; the answer is still ours
+            counters["redisErrors"] += 1
+            logger.warning(f"Single-flight publish failed: {str(e)}")
+        return result
+    finally:
+        try:
+            # Release only our own lease
+            if await redis.get(f"singleflight:lock:{key}") == token.encode():
+                await redis.delete(f"singleflight:lock:{key}")
+        except Exception as e:
+            counters["redisErrors"] += 1
+            logger.warning(f"Single-flight release failed: {str(e)}")
+
+async def do(key: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Run fn once for all concurrent callers with the same key and share its JSON result"""
+    if not SINGLE_FLIGHT:
+        return await fn()
+
+    future = _in_flight.get(key)
+    if future is not None:
+        counters["coalesced"] += 1
+    else:
+        counters["leaders"] += 1
+        future = asyncio.ensure_future(_run_shared(key, fn))
+        _in_flight[key] = future
+        future.add_done_callback(lambda done: _in_flight.pop(key, None))
+
+    # A caller that disconnects must not cancel the work the others are waiting on
+    return await asyncio.shield(future)
+
+def stats() -> Dict[str, int]:
+    return {"inFlight": len(_in_flight), **counters}
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+from urllib.parse import quote
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Maintain a BM25 index of document chunks and fuse it with dense results
+HYBRID_RETRIEVAL = os.getenv('HYBRID_RETRIEVAL', 'false').lower() == 'true'
+
+# One SQLite FTS5 database per workspace; must be shared by workers and the API
+SPARSE_INDEX_DIR = os.getenv('SPARSE_INDEX_DIR', 'sparse_index')
+
+# Bytes of each database read through mmap instead of read() calls
+SPARSE_MMAP_BYTES = int(os.getenv('SPARSE_MMAP_BYTES', str(256 * 1024 * 1024)))
+
+# Open databases kept per thread; the least recently used is closed beyond this
+SPARSE_MAX_CONNECTIONS = int(os.getenv('SPARSE_MAX_CONNECTIONS', '8'))
+
+TERM = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    document_id TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_document_id ON chunks (document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5 (text, tokenize = 'unicode61');
+"""
+
+_local = threading.local()
+
+def _database_path(workspace_id: str) -> str:
+    return os.path.join(SPARSE_INDEX_DIR, f"{quote(workspace_id, safe='')}.db")
+
+def _connect(workspace_id: str) -> sqlite3.Connection:
+    """Per-thread connection to a workspace's database, reopened after fork"""
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = OrderedDict()
+        _local.pid = os.getpid()
+
+    connection = connections.get(workspace_id)
+    if connection is not None:
+        connections.move_to_end(workspace_id)
+    else:
+        os.makedirs(SPARSE_INDEX_DIR, exist_ok=True)
+        connection = sqlite3.connect(_database_path(workspace_id), timeout=30.0)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA mmap_size = {SPARSE_MMAP_BYTES}")
+        connection.executescript(SCHEMA)
+        connections[workspace_id] = connection
+        # Each open database holds several file descriptors; many tenants would exhaust them
+        while len(connections) > SPARSE_MAX_CONNECTIONS:
+            _, evicted = connections.popitem(last=False)
+            evicted.close()
+    return connection
+
+def _delete_rows(connection: sqlite3.Connection, rowids: List[int]):
+    connection.executemany("DELETE FROM chunks_fts WHERE rowid = ?", [(rowid,) for rowid in rowids])
+    connection.executemany("DELETE FROM chunks WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+def index_chunks(workspace_id: str, records: List[Dict[str, Any]]):
+    """Add or replace {id, metadata} chunk records; the text is read from metadata["text"]"""
+    if not records:
+        return
+
+    connection = _connect(workspace_id)
+    with connection:
+        ids = [record["id"] for record in records]
+        placeholders = ",".join("?" * len(ids))
+        replaced = connection.execute(
+            f"SELECT rowid FROM chunks WHERE id IN ({placeholders})", ids
+        ).fetchall()
+        _delete_rows(connection, [rowid for rowid, in replaced])
+
+        for record in records:
+            metadata = dict(record["metadata"])
+            text = metadata.pop("text")
+            cursor = connection.execute(
+                "INSERT INTO chunks (id, document_id, metadata) VALUES (?, ?, ?)",
+                (record["id"], metadata.get("documentId"), json.dumps(metadata))
+            )
+            connection.execute(
+                "INSERT INTO chunks_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text)
+            )
+
+def delete_chunks(workspace_id: str, ids: List[str]) -> int:
+    if not ids or not os.path.exists(_database_path(workspace_id)):
+        return 0
+
+    connection = _connect(workspace_id)
+    with connection:
+        rowids = []
+        for start in range(0, len(ids), 500):
+            page = ids[start:start + 500]
+            rowids.extend(rowid for rowid, in connection.execute(
+                f"SELECT rowid FROM chunks WHERE id IN ({','.join('?' * len(page))})", page
+            ))
+        _delete_rows(connection, rowids)
+    return len(rowids)
+
+def delete_document_chunks(workspace_id: str, document_id: str) -> int:
+    if not os.path.exists(_database_path(workspace_id)):
+        return 0
+
+    connection = _connect(workspace_id)
+    with connection:
+        rowids = [rowid for rowid, in connection.execute(
+            "SELECT rowid FROM chunks WHERE document_id = ?", (document_id,)
+        )]
+        _delete_rows(connection, rowids)
+    return len(rowids)
+
+def match_expression(query: str) -> str:
+    # Quote every term so user input cannot inject FTS5 query syntax
+    terms = dict.fromkeys(term.lower() for term in TERM.findall(query))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+def search(workspace_id: str, query: str, k: int) -> List[Tuple[str, str, Dict[str, Any], float]]:
+    """BM25 top-k chunks as (id, text, metadata, score), best first"""
+    expression = match_expression(query)
+    if not expression or k <= 0 or not os.path.exists(_database_path(workspace_id)):
+        return []
+
+    rows = _connect(workspace_id).execute(
+        """
+        SELECT chunks.id, chunks_fts.text, chunks.metadata, bm25(chunks_fts)
+        FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+        WHERE chunks_fts MATCH ?
+        ORDER BY bm25(chunks_fts)
+        LIMIT ?
+        """,
+        (expression, k)
+    ).fetchall()
+    # bm25() is lower-is-better; flip it so higher scores rank first
+    return [(vid, text, json.loads(metadata), -score) for vid, text, metadata, score in rows]
+
+async def asearch(workspace_id: str, query: str, k: int) -> List[Tuple[str, str, Dict[str, Any], float]]:
+    return await asyncio.to_thread(search, workspace_id, query, k)
@@ -0,0 +1,36 @@
+import contextvars
+import logging
+import re
+import uuid
+from typing import Optional
+
+TRACE_HEADER = "X-Trace-ID"
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('trace_id', default=None)
+
+_valid = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def get_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+def set_trace_id(trace_id: Optional[str]) -> contextvars.Token:
+    return _trace_id.set(trace_id)
+
+def reset_trace_id(token: contextvars.Token):
+    _trace_id.reset(token)
+
+def trace_id_from_header(value: Optional[str]) -> str:
+    """Caller-supplied trace ID if it is safe to log, otherwise a fresh one"""
+    if value and _valid.match(value):
+        return value
+    return new_trace_id()
+
+class TraceIdFilter(logging.Filter):
+    """Adds record.trace_id so handlers can format it with %(trace_id)s"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = get_trace_id() or "-"
+        return True
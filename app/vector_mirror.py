@@ -0,0 +1,469 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import quote
+import numpy as np
+from dotenv import load_dotenv
+from .metadata_filter import filter_candidates, INDEXED_FIELDS
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# "off", "int8" or "float16": keep a quantized local copy of every namespace for queries
+VECTOR_MIRROR = os.getenv('VECTOR_MIRROR', 'off').lower()
+VECTOR_MIRROR_DIR = os.getenv('VECTOR_MIRROR_DIR', 'vector_mirror')
+
+# Quantized candidates per requested result that are rescored at full precision
+MIRROR_RESCORE_FACTOR = int(os.getenv('MIRROR_RESCORE_FACTOR', '4'))
+
+# Candidate rows dequantized at a time for first-stage scoring, bounding per-query memory
+MIRROR_SCORE_BLOCK_ROWS = int(os.getenv('MIRROR_SCORE_BLOCK_ROWS', '4096'))
+
+CODE_TYPES = {"int8": np.int8, "float16": np.float16}
+
+def _unit(vectors) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+class ReadWriteLock:
+    """Many reader threads or one writer thread; waiting writers hold back new readers"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class MirrorShard:
+    """Append-only quantized copy of one namespace
+
+    Quantized codes (and per-row int8 scales) are held in memory for first-stage
+    scoring; full-precision rows stay on disk and are read through mmap only for
+    the candidates being rescored. The .jsonl log maps IDs to rows and is written
+    last, so a row only becomes visible once all of its data is on disk. Other
+    processes catch up by applying the log lines appended since they last read it,
+    reading only the codes of the new rows.
+    """
+
+    def __init__(self, base_path: str, code_type: str):
+        self.base_path = base_path
+        self.code_type = code_type
+        self.dtype = CODE_TYPES[code_type]
+        self.lock = ReadWriteLock()
+        # The log's first line names its generation, so a log recreated by compaction
+        # is noticed even if it reuses the inode
+        self.header: Optional[bytes] = None
+        self.log_inode: Optional[int] = None
+        self.log_offset = 0
+        self._reset()
+
+    def _path(self, suffix: str) -> str:
+        return f"{self.base_path}.{suffix}"
+
+    def _reset(self):
+        self.dim: Optional[int] = None
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self.full: Optional[np.ndarray] = None
+        # codes and scales are views of these, which grow by doubling as rows are appended
+        self._codes_buffer: Optional[np.ndarray] = None
+        self._scales_buffer: Optional[np.ndarray] = None
+        self.rows: Dict[str, int] = {}
+        self.ids: Dict[int, str] = {}
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[tuple, Set[int]] = defaultdict(set)
+
+    def _log_stat(self):
+        try:
+            stat = os.stat(self._path("jsonl"))
+            return stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            return None, 0
+
+    def _read_header(self) -> Optional[bytes]:
+        try:
+            with open(self._path("jsonl"), "rb") as f:
+                line = f.readline()
+        except FileNotFoundError:
+            return None
+        return line if line.endswith(b"\n") else None
+
+    def stale(self) -> bool:
+        # A compacted log can reuse the old inode and come out the same size,
+        # so the generation header is what tells the two apart
+        return self._log_stat() != (self.log_inode, self.log_offset) or self._read_header() != self.header
+
+    def refresh(self):
+        """Catch up with disk: apply new log lines, or reload after a compaction or reset"""
+        inode, size = self._log_stat()
+        if inode != self.log_inode or size < self.log_offset or self._read_header() != self.header:
+            self.load()
+        elif size > self.log_offset:
+            self._replay(self.log_offset)
+
+    def complete(self) -> bool:
+        """Whether a rebuild has copied every vector of the namespace into this shard"""
+        return os.path.exists(self._path("complete"))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _remember(self, vid: str, row: int, metadata: Dict[str, Any]):
+        self._forget(vid)
+        self.rows[vid] = row
+        self.ids[row] = vid
+        self.metadata[row] = metadata
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self.postings[(field, metadata[field])].add(row)
+
+    def _forget(self, vid: str):
+        row = self.rows.pop(vid, None)
+        if row is None:
+            return
+        del self.ids[row]
+        metadata = self.metadata.pop(row)
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self.postings[(field, metadata[field])].discard(row)
+
+    def load(self):
+        self._reset()
+        self.log_inode, _ = self._log_stat()
+        self.log_offset = 0
+        self.header = self._read_header()
+        self._replay(0)
+
+    def _row_count(self) -> int:
+        return len(self.codes) if self.codes is not None else 0
+
+    def _replay(self, offset: int):
+        if self.log_inode is None:
+            return
+        with open(self._path("jsonl"), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A line still being written (or cut short by a crash) is picked up next time
+        complete = data[:data.rfind(b"\n") + 1]
+        entries = [json.loads(line) for line in complete.splitlines()]
+
+        for entry in entries:
+            if "dim" in entry:
+                self.dim = entry["dim"]
+        end = max((entry["row"] + 1 for entry in entries if "row" in entry), default=0)
+        if end > self._row_count():
+            self._read_rows(self._row_count(), end)
+
+        for entry in entries:
+            if entry.get("deleted"):
+                self._forget(entry["id"])
+            elif "row" in entry:
+                self._remember(entry["id"], entry["row"], entry["metadata"])
+        self.log_offset = offset + len(complete)
+
+    def _read_rows(self, start: int, end: int):
+        """Load the codes and scales of rows start..end-1 from disk"""
+        count = end - start
+        codes = np.fromfile(
+            self._path("codes"), dtype=self.dtype, count=count * self.dim,
+            offset=start * self.dim * np.dtype(self.dtype).itemsize
+        ).reshape(count, self.dim)
+        scales = np.fromfile(self._path("scales"), dtype=np.float32, count=count, offset=start * 4)
+        self._extend(start, codes, scales)
+
+    def _map_full(self, rows: int):
+        if rows:
+            self.full = np.memmap(self._path("full"), dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _extend(self, first_row: int, codes: np.ndarray, scales: np.ndarray):
+        """Place appended rows in the in-memory codes and scales without rereading the files"""
+        end = first_row + len(codes)
+        if self._codes_buffer is None or len(self._codes_buffer) < end:
+            capacity = max(end, 2 * (len(self._codes_buffer) if self._codes_buffer is not None else 0))
+            codes_buffer = np.empty((capacity, self.dim), dtype=self.dtype)
+            scales_buffer = np.empty(capacity, dtype=np.float32)
+            if self._codes_buffer is not None:
+                kept = min(first_row, len(self._codes_buffer))
+                codes_buffer[:kept] = self._codes_buffer[:kept]
+                scales_buffer[:kept] = self._scales_buffer[:kept]
+            self._codes_buffer, self._scales_buffer = codes_buffer, scales_buffer
+        self._codes_buffer[first_row:end] = codes
+        self._scales_buffer[first_row:end] = scales
+        self.codes, self.scales = self._codes_buffer[:end], self._scales_buffer[:end]
+        self._map_full(end)
+
+    def _quantize(self, unit: np.ndarray):
+        if self.code_type == "int8":
+            scales = np.maximum(np.abs(unit).max(axis=1), 1e-12) / 127.0
+            codes = np.round(unit / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(unit), dtype=np.float32)
+            codes = unit.astype(np.float16)
+        return codes, scales.astype(np.float32)
+
+    def _log(self, entries: List[Dict[str, Any]]):
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+        with open(self._path("jsonl"), "ab") as f:
+            # Drop a partial line left by a writer that crashed mid-append
+            if f.tell() != self.log_offset:
+                f.truncate(self.log_offset)
+            f.write(data)
+        self.log_inode, _ = self._log_stat()
+        self.log_offset += len(data)
+
+    def append(self, vectors: List[Dict[str, Any]]):
+        unit = _unit([vector["values"] for vector in vectors])
+        if self.dim is None:
+            self.dim = unit.shape[1]
+            self._log([{"dim": self.dim, "generation": uuid.uuid4().hex}])
+            self.header = self._read_header()
+        elif unit.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {unit.shape[1]} does not match mirror dimension {self.dim}")
+
+        codes, scales = self._quantize(unit)
+        first_row = os.path.getsize(self._path("full")) // (self.dim * 4) if os.path.exists(self._path("full")) else 0
+        # Rows written by an interrupted append are never logged and simply skipped
+        for suffix, data in (("full", unit), ("codes", codes), ("scales", scales)):
+            with open(self._path(suffix), "r+b" if os.path.exists(self._path(suffix)) else "wb") as f:
+                f.seek(first_row * (data.nbytes // len(data)))
+                f.write(data.tobytes())
+                f.truncate()
+
+        entries = [{
+            "id": vector["id"],
+            "row": first_row + i,
+            "metadata": dict(vector.get("metadata") or {})
+        } for i, vector in enumerate(vectors)]
+        self._log(entries)
+
+        # The caller holds the shard's exclusive lock and loaded it first, so memory only
+        # needs this append applied to match the files
+        self._extend(first_row, codes, scales)
+        for entry in entries:
+            self._remember(entry["id"], entry["row"], entry["metadata"])
+
+    def delete(self, ids: List[str]) -> int:
+        if self.dim is None:
+            return 0
+        present = [vid for vid in ids if vid in self.rows]
+        if present:
+            self._log([{"id": vid, "deleted": True} for vid in present])
+            for vid in present:
+                self._forget(vid)
+        return len(present)
+
+    def search(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False
+    ) -> List[Dict[str, Any]]:
+        if self.full is None or not self.rows:
+            return []
+
+        rows = filter_candidates(self.postings, self.metadata, filter) if filter else list(self.ids)
+        if not rows:
+            return []
+        rows = np.asarray(rows, dtype=np.int64)
+        query = _unit(vector)[0]
+
+        # First stage: approximate scores from the quantized codes, a block at a time so
+        # only one block is ever widened to float32
+        approximate = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), MIRROR_SCORE_BLOCK_ROWS):
+            block = rows[start:start + MIRROR_SCORE_BLOCK_ROWS]
+            approximate[start:start + len(block)] = (self.codes[block].astype(np.float32) @ query) * self.scales[block]
+        shortlist = min(len(rows), top_k * MIRROR_RESCORE_FACTOR)
+        if shortlist < len(rows):
+            rows = rows[np.argpartition(-approximate, shortlist - 1)[:shortlist]]
+
+        # Second stage: exact cosine over the shortlisted full-precision rows
+        rows = np.sort(rows)
+        full = np.asarray(self.full[rows])
+        exact = full @ query
+
+        matches = []
+        for i in np.argsort(-exact)[:top_k]:
+            row = int(rows[i])
+            match = {
+                "id": self.ids[row],
+                "score": float(exact[i]),
+                "metadata": dict(self.metadata[row])
+            }
+            if include_values:
+                match["values"] = full[i].tolist()
+            matches.append(match)
+        return matches
+
+    def compact(self):
+        """Rewrite the shard with only its live rows"""
+        live = sorted(self.ids)
+        vectors = [{
+            "id": self.ids[row],
+            "values": np.asarray(self.full[row]),
+            "metadata": self.metadata[row]
+        } for row in live] if self.full is not None else []
+
+        for suffix in ("jsonl", "full", "codes", "scales"):
+            if os.path.exists(self._path(suffix)):
+                os.unlink(self._path(suffix))
+        self._reset()
+        self.header, self.log_inode, self.log_offset = None, None, 0
+        if vectors:
+            self.append(vectors)
+
+class VectorMirror:
+    """Per-namespace quantized mirror kept in step with upserts and deletes
+
+    A namespace is only queried once rebuild_mirror has copied all of it into the
+    local shard and marked it complete. Until then (mirror enabled after data
+    existed, workers on another host, interrupted rebuild) queries go to the backend.
+    """
+
+    def __init__(self, directory: str = VECTOR_MIRROR_DIR, code_type: str = VECTOR_MIRROR):
+        if code_type not in CODE_TYPES:
+            raise ValueError(f"Unknown VECTOR_MIRROR: {code_type}")
+        self.directory = directory
+        self.code_type = code_type
+        os.makedirs(directory, exist_ok=True)
+        self._shards: Dict[str, MirrorShard] = {}
+        self._lock = threading.RLock()
+
+    def _get_shard(self, namespace: str) -> MirrorShard:
+        shard = self._shards.get(namespace)
+        if shard is None:
+            name = quote(namespace, safe="") or "__default__"
+            shard = MirrorShard(os.path.join(self.directory, name), self.code_type)
+            self._shards[namespace] = shard
+        return shard
+
+    def _shard(self, namespace: str) -> MirrorShard:
+        with self._lock:
+            return self._get_shard(namespace)
+
+    @contextmanager
+    def _file_lock(self, shard: MirrorShard, exclusive: bool):
+        with open(f"{shard.base_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self, namespace: str):
+        shard = self._shard(namespace)
+        with shard.lock.writing(), self._file_lock(shard, exclusive=True):
+            if shard.stale():
+                shard.refresh()
+            yield shard
+
+    @contextmanager
+    def _reading(self, namespace: str):
+        shard = self._shard(namespace)
+        if shard.stale():
+            with shard.lock.writing(), self._file_lock(shard, exclusive=False):
+                if shard.stale():
+                    shard.refresh()
+        # Searches only touch memory and rows already on disk, so they share the shard
+        with shard.lock.reading():
+            yield shard
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> bool:
+        """Mirror a write already made to the backend; False if the namespace had to be marked incomplete"""
+        try:
+            with self._writing(namespace) as shard:
+                shard.append(vectors)
+                # Replaced and deleted rows stay on disk until there are as many as live ones
+                if shard.full is not None and len(shard.full) > 2 * max(len(shard), 1024):
+                    shard.compact()
+            return True
+        except Exception as e:
+            # The backend has the write; the mirror no longer matches it
+            logger.error(f"Mirror upsert failed for namespace {namespace!r}, marking it incomplete: {str(e)}")
+            self.mark_incomplete(namespace)
+            return False
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        try:
+            with self._writing(namespace) as shard:
+                shard.delete(ids)
+        except Exception as e:
+            logger.error(f"Mirror delete failed for namespace {namespace!r}, marking it incomplete: {str(e)}")
+            self.mark_incomplete(namespace)
+
+    def mark_complete(self, namespace: str = ""):
+        """Record that the shard holds every vector of the namespace (end of a rebuild)"""
+        with self._writing(namespace) as shard:
+            with open(f"{shard.base_path}.complete", "w"):
+                pass
+
+    def mark_incomplete(self, namespace: str = ""):
+        with self._lock:
+            path = f"{self._get_shard(namespace).base_path}.complete"
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: str = ""
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Matches from the mirror, or None when the backend should answer instead"""
+        try:
+            if not self._shard(namespace).complete():
+                return None
+            with self._reading(namespace) as shard:
+                return shard.search(vector, top_k, filter, include_values)
+        except Exception as e:
+            logger.error(f"Mirror query failed for namespace {namespace!r}, using the backend: {str(e)}")
+            return None
+
+    def reset(self, namespace: str = ""):
+        """Drop everything mirrored for a namespace"""
+        with self._writing(namespace) as shard:
+            for suffix in ("complete", "jsonl", "full", "codes", "scales"):
+                path = f"{shard.base_path}.{suffix}"
+                if os.path.exists(path):
+                    os.unlink(path)
+            shard.load()
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import threading
+from contextlib import ExitStack
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+from dotenv import load_dotenv
+from .vector_mirror import VectorMirror, VECTOR_MIRROR
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# "pinecone" or "faiss" (local, on-disk index under FAISS_INDEX_DIR)
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'pinecone').lower()
+
+# Threads and pooled HTTP connections shared by every request in this process
+PINECONE_POOL_SIZE = int(os.getenv('PINECONE_POOL_SIZE', '8'))
+
+# Connections kept open by the async query client used on the request path
+PINECONE_ASYNC_POOL_SIZE = int(os.getenv('PINECONE_ASYNC_POOL_SIZE', '256'))
+
+# Vectors per upsert request; keeps 3072-dim payloads under Pinecone's 2MB request cap
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv('PINECONE_UPSERT_BATCH_SIZE', '50'))
+
+# Pinecone caps fetch at 1000 IDs but full vectors make large pages slow; delete takes 1000
+PINECONE_FETCH_BATCH_SIZE = int(os.getenv('PINECONE_FETCH_BATCH_SIZE', '100'))
+PINECONE_DELETE_BATCH_SIZE = 1000
+
+# "shared" keeps every vector in the default namespace; "namespace" gives each
+# workspace its own message and document namespaces
+VECTOR_PARTITIONING = os.getenv('VECTOR_PARTITIONING', 'shared').lower()
+
+MESSAGES = "messages"
+DOCUMENTS = "documents"
+
+def namespace_for(workspace_id: str, kind: str) -> str:
+    """Namespace holding a workspace's messages or documents under the configured partitioning"""
+    if VECTOR_PARTITIONING == "namespace":
+        return f"{workspace_id}:{kind}"
+    return ""
+
+def workspace_namespaces(workspace_id: str) -> List[str]:
+    return list(dict.fromkeys(namespace_for(workspace_id, kind) for kind in (MESSAGES, DOCUMENTS)))
+
+class PineconeBackend:
+    """Pooled Pinecone index handle plus an async client for the query path"""
+
+    def __init__(self, index_name: Optional[str] = None):
+        from pinecone import Pinecone
+        from pinecone.core.openapi.shared import API_VERSION
+
+        pc = Pinecone(
+            api_key=os.getenv('PINECONE_API_KEY'),
+            pool_threads=PINECONE_POOL_SIZE
+        )
+        pc.openapi_config.connection_pool_maxsize = PINECONE_POOL_SIZE
+
+        if index_name:
+            host = pc.describe_index(index_name).host
+        else:
+            host = os.getenv('PINECONE_HOST') or pc.describe_index(os.getenv('PINECONE_INDEX')).host
+
+        self._exit_stack = ExitStack()
+        self.index = self._exit_stack.enter_context(pc.Index(host=host))
+        self.host = host if host.startswith("http") else f"https://{host}"
+        self.api_version = API_VERSION
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        """Pooled client for the Pinecone data plane, bound to the running event loop"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.host,
+                headers={
+                    "Api-Key": os.getenv('PINECONE_API_KEY', ''),
+                    "X-Pinecone-API-Version": self.api_version,
+                },
+                limits=httpx.Limits(
+                    max_connections=PINECONE_ASYNC_POOL_SIZE,
+                    max_keepalive_connections=PINECONE_ASYNC_POOL_SIZE
+                ),
+                timeout=httpx.Timeout(30.0)
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def close(self):
+        self._exit_stack.close()
+
+    async def aquery(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        include_values: bool = False,
+        namespace: str = ""
+    ) -> List[Dict[str, Any]]:
+        body = {
+            "vector": vector,
+            "topK": top_k,
+            "includeMetadata": True,
+            "includeValues": include_values,
+            "namespace": namespace,
+        }
+        if filter:
+            body["filter"] = filter
+
+        response = await self.get_async_client().post("/query", json=body)
+        response.raise_for_status()
+        if include_values:
+            # Parsing thousands of floats per match would stall the event loop
+            return (await asyncio.to_thread(response.json)).get("matches", [])
+        return response.json().get("matches", [])
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "") -> int:
+        self.index.upsert(
+            vectors=vectors,
+            namespace=namespace,
+            batch_size=PINECONE_UPSERT_BATCH_SIZE,
+            show_progress=False
+        )
+        return len(vectors)
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, Dict[str, Any]]:
+        found = {}
+        for start in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=ids[start:start + PINECONE_FETCH_BATCH_SIZE], namespace=namespace)
+            for vid, vector in response.vectors.items():
+                found[vid] = {
+                    "id": vid,
+                    "values": list(vector.values),
+                    "metadata": dict(vector.metadata or {})
+                }
+        return found
+
+    def list_ids(self, prefix: str, namespace: str = "") -> Iterator[str]:
+        # Listing by prefix is only supported on serverless indexes
+        for page in self.index.list(prefix=prefix, namespace=namespace):
+            yield from page
+
+    def delete(self, ids: List[str], namespace: str = "") -> int:
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[start:start + PINECONE_DELETE_BATCH_SIZE], namespace=namespace)
+        return len(ids)
+
+    def namespaces(self) -> List[str]:
+        return list(self.index.describe_index_stats().namespaces.keys())
+
+_lock = threading.Lock()
+_pid: Optional[int] = None
+_backend = None
+_mirror = None
+
+def create_backend(target: Optional[str] = None):
+    """Backend for the configured index, or for target (a Pinecone index name or FAISS directory)"""
+    if VECTOR_BACKEND == "faiss":
+        from .faiss_store import FaissBackend
+        return FaissBackend(target) if target else FaissBackend()
+    if VECTOR_BACKEND == "pinecone":
+        return PineconeBackend(target)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+
+def init_vector_store():
+    """Create the process-wide vector store backend"""
+    global _pid, _backend, _mirror
+
+    with _lock:
+        # A forked child must not reuse the parent's sockets
+        if _backend is not None and _pid == os.getpid():
+            return _backend
+
+        _backend = create_backend()
+        _mirror = VectorMirror() if VECTOR_MIRROR != "off" else None
+        _pid = os.getpid()
+
+        logger.info(f"Vector store initialized ({VECTOR_BACKEND})")
+        return _backend
+
+def get_backend():
+    if _backend is None or _pid != os.getpid():
+        return init_vector_store()
+    return _backend
+
+def get_mirror() -> Optional[VectorMirror]:
+    get_backend()
+    return _mirror
+
+def close_vector_store():
+    """Release connections or file handles held by the backend"""
+    global _pid, _backend, _mirror
+
+    with _lock:
+        if _backend is not None and _pid == os.getpid():
+            _backend.close()
+            logger.info("Vector store closed")
+
+        _pid = None
+        _backend = None
+        _mirror = None
+
+async def aclose_async_client():
+    if _backend is not None and _pid == os.getpid():
+        await _backend.aclose()
+
+async def aquery(
+    vector: List[float],
+    top_k: int,
+    filter: Optional[Dict[str, Any]] = None,
+    include_values: bool = False,
+    namespace: str = ""
+) -> List[Dict[str, Any]]:
+    """Query the index without blocking the event loop, returning raw matches"""
+    mirror = get_mirror()
+    if mirror is not None:
+        matches = await asyncio.to_thread(mirror.query, vector, top_k, filter, include_values, namespace)
+        if matches is not None:
+            return matches
+    return await get_backend().aquery(vector, top_k, filter, include_values, namespace)
+
+def upsert(vectors: List[Dict[str, Any]], namespace: str = "") -> int:
+    """Write {id, values, metadata} records in request-sized batches"""
+    if not vectors:
+        return 0
+    count = get_backend().upsert(vectors, namespace)
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.upsert(vectors, namespace)
+    return count
+
+def fetch(ids: List[str], namespace: str = "") -> Dict[str, Dict[str, Any]]:
+    """Look up vectors by ID in pages, returning {id: {id, values, metadata}}"""
+    if not ids:
+        return {}
+    return get_backend().fetch(ids, namespace)
+
+def list_ids(prefix: str, namespace: str = "") -> Iterator[str]:
+    """Enumerate vector IDs starting with prefix"""
+    return get_backend().list_ids(prefix, namespace)
+
+def delete(ids: List[str], namespace: str = "") -> int:
+    if not ids:
+        return 0
+    count = get_backend().delete(ids, namespace)
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.delete(ids, namespace)
+    return count
+
+def list_namespaces() -> List[str]:
+    return get_backend().namespaces()
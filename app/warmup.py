@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from .context_packer import get_encoding
+from .embeddings import get_embeddings
+from .llm import get_llm, get_prompt, RESPONSE_PROMPT, KNOWLEDGE_BASE_PROMPT
+from .processor import preload_modules
+from .redis_client import get_redis
+from .vectorstore import init_vector_store
+
+load_dotenv()
+
+logger = logging.getLogger('rag_service')
+
+# Seconds between attempts at warm-up steps that failed, e.g. while Pinecone is unreachable
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '5'))
+
+def _warm_llm():
+    get_llm()
+    get_prompt(RESPONSE_PROMPT)
+    get_prompt(KNOWLEDGE_BASE_PROMPT)
+
+def _warm_tokenizer():
+    if get_encoding() is None:
+        raise RuntimeError("tokenizer not loaded; token counts are estimated")
+
+def _warm_redis():
+    get_redis().ping()
+
+STEPS: Dict[str, Callable[[], Any]] = {
+    "modules": preload_modules,
+    "vectorStore": init_vector_store,
+    "tokenizer": _warm_tokenizer,
+    "embeddings": get_embeddings,
+    "llm": _warm_llm,
+    "redis": _warm_redis,
+}
+
+components: Dict[str, Dict[str, Any]] = {name: {"ready": False} for name in STEPS}
+
+def _run_step(name: str):
+    started = time.perf_counter()
+    try:
+        STEPS[name]()
+        components[name] = {"ready": True, "seconds": round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        components[name] = {"ready": False, "error": str(e)}
+        logger.warning(f"Warm-up step {name} failed: {str(e)}")
+
+async def warm_up():
+    """Load modules and create clients off the event loop, retrying failed steps until all are warm"""
+    started = time.perf_counter()
+    while True:
+        pending = [name for name, state in components.items() if not state["ready"]]
+        if not pending:
+            break
+        await asyncio.gather(*(run_in_threadpool(_run_step, name) for name in pending))
+        if not all(state["ready"] for state in components.values()):
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+
+def is_ready() -> bool:
+    return all(state["ready"] for state in components.values())
+
+def status() -> Dict[str, Any]:
+    return {"ready": is_ready(), "components": components}
@@ -0,0 +1,281 @@
+"""In-process stand-ins for the OpenAI API and the Pinecone data plane
+
+Both fakes are FastAPI apps served by uvicorn on a background thread, with a fixed
+latency and an error rate injected into every call, so the service can be load
+tested on a machine with no network.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+@dataclass
+class Faults:
+    latency_ms: float = 0.0
+    error_rate: float = 0.0
+    # Share of injected errors answered with 429 instead of 500
+    rate_limit_share: float = 0.5
+
+    async def inject(self) -> Optional[JSONResponse]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            if random.random() < self.rate_limit_share:
+                return JSONResponse(
+                    {"error": {"message": "Rate limit reached", "type": "requests"}},
+                    status_code=429,
+                    headers={"retry-after-ms": "50"}
+                )
+            return JSONResponse({"error": {"message": "Injected failure"}}, status_code=500)
+        return None
+
+@lru_cache(maxsize=4096)
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector, so identical texts embed identically"""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "10000",
+    "x-ratelimit-remaining-requests": "9999",
+    "x-ratelimit-reset-requests": "6ms",
+    "x-ratelimit-limit-tokens": "10000000",
+    "x-ratelimit-remaining-tokens": "9999000",
+    "x-ratelimit-reset-tokens": "6ms",
+}
+
+def create_openai_app(faults: Faults, dimensions: int = 3072, completion: str = "This is a benchmark answer.") -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        size = body.get("dimensions") or dimensions
+        data = []
+        for i, item in enumerate(inputs):
+            # langchain sends pre-tokenized input as lists of token IDs
+            text = item if isinstance(item, str) else json.dumps(item)
+            data.append({"object": "embedding", "index": i, "embedding": fake_embedding(text, size)})
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        }, headers=RATE_LIMIT_HEADERS)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        body = await request.json()
+        created = int(time.time())
+        base = {"id": "chatcmpl-bench", "created": created, "model": body.get("model")}
+
+        if not body.get("stream"):
+            return JSONResponse({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": completion},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+            }, headers=RATE_LIMIT_HEADERS)
+
+        async def events():
+            for word in completion.split(" "):
+                chunk = {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=RATE_LIMIT_HEADERS)
+
+    @app.get("/files/{name}")
+    async def files(name: str, paragraphs: int = 50):
+        """Text documents for process_document to download"""
+        text = "\n\n".join(
+            f"Section {i} of {name}. " + " ".join(f"term{(i * 7 + j) % 500}" for j in range(120)) + "."
+            for i in range(paragraphs)
+        )
+        return PlainTextResponse(text)
+
+    return app
+
+class Namespace:
+    def __init__(self):
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self._matrix = None
+
+    def changed(self):
+        self._matrix = None
+
+    def matrix(self):
+        """IDs and unit-normalized rows, rebuilt only after a write"""
+        if self._matrix is None:
+            ids = list(self.vectors)
+            rows = np.stack([self.vectors[vid] for vid in ids]) if ids else np.zeros((0, 1), dtype=np.float32)
+            rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+            self._matrix = (ids, {vid: i for i, vid in enumerate(ids)}, rows)
+        return self._matrix
+
+def _matches(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    for key, condition in (filter or {}).items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            for op, arg in condition.items():
+                if op == "$eq" and value != arg:
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+def create_pinecone_app(faults: Faults) -> FastAPI:
+    app = FastAPI()
+    namespaces: Dict[str, Namespace] = {}
+
+    def namespace(name: Optional[str]) -> Namespace:
+        return namespaces.setdefault(name or "", Namespace())
+
+    @app.post("/vectors/upsert")
+    async def upsert(request: Request):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        body = await request.json()
+        ns = namespace(body.get("namespace"))
+        for vector in body["vectors"]:
+            ns.vectors[vector["id"]] = np.asarray(vector["values"], dtype=np.float32)
+            ns.metadata[vector["id"]] = vector.get("metadata") or {}
+        ns.changed()
+        return {"upsertedCount": len(body["vectors"])}
+
+    @app.post("/query")
+    async def query(request: Request):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        body = await request.json()
+        ns = namespace(body.get("namespace"))
+        all_ids, rows_by_id, matrix = ns.matrix()
+        ids = [vid for vid in all_ids if _matches(ns.metadata[vid], body.get("filter"))]
+        matches = []
+        if ids:
+            query_vector = np.asarray(body["vector"], dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+            scores = matrix[[rows_by_id[vid] for vid in ids]] @ query_vector
+            for i in np.argsort(-scores)[:body.get("topK", 10)]:
+                match = {"id": ids[i], "score": float(scores[i])}
+                if body.get("includeMetadata"):
+                    match["metadata"] = ns.metadata[ids[i]]
+                if body.get("includeValues"):
+                    match["values"] = ns.vectors[ids[i]].tolist()
+                matches.append(match)
+        # JSONResponse skips FastAPI's per-element encoding of large float lists
+        return JSONResponse({"matches": matches, "namespace": body.get("namespace", "")})
+
+    @app.get("/vectors/fetch")
+    async def fetch(ids: List[str] = Query(...), namespace_name: str = Query("", alias="namespace")):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        ns = namespace(namespace_name)
+        return JSONResponse({
+            "vectors": {
+                vid: {"id": vid, "values": ns.vectors[vid].tolist(), "metadata": ns.metadata[vid]}
+                for vid in ids if vid in ns.vectors
+            },
+            "namespace": namespace_name
+        })
+
+    @app.get("/vectors/list")
+    async def list_vectors(
+        prefix: str = "",
+        limit: int = 100,
+        paginationToken: Optional[str] = None,
+        namespace_name: str = Query("", alias="namespace")
+    ):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        ids = sorted(vid for vid in namespace(namespace_name).vectors if vid.startswith(prefix))
+        start = int(paginationToken or 0)
+        page = ids[start:start + limit]
+        response = {"vectors": [{"id": vid} for vid in page], "namespace": namespace_name}
+        if start + limit < len(ids):
+            response["pagination"] = {"next": str(start + limit)}
+        return response
+
+    @app.post("/vectors/delete")
+    async def delete(request: Request):
+        error = await faults.inject()
+        if error is not None:
+            return error
+        body = await request.json()
+        ns = namespace(body.get("namespace"))
+        for vid in body.get("ids") or []:
+            ns.vectors.pop(vid, None)
+            ns.metadata.pop(vid, None)
+        ns.changed()
+        return {}
+
+    @app.post("/describe_index_stats")
+    async def describe_index_stats():
+        return {
+            "namespaces": {name: {"vectorCount": len(ns.vectors)} for name, ns in namespaces.items()},
+            "totalVectorCount": sum(len(ns.vectors) for ns in namespaces.values()),
+            "indexFullness": 0.0
+        }
+
+    return app
+
+class BackgroundServer:
+    """Serve an ASGI app on an ephemeral localhost port from a daemon thread"""
+
+    def __init__(self, app, lifespan: str = "off"):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan=lifespan))
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._sock]}, daemon=True)
+
+    def start(self) -> "BackgroundServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
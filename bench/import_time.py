@@ -0,0 +1,85 @@
+"""Import-time budget check for the service's entry points
+
+Imports each module in a fresh interpreter with -X importtime, several times,
+and keeps the fastest run. Exits non-zero when a module goes over budget, so
+it can gate CI:
+
+    python -m bench.import_time --budget-ms 1500 --modules app.main,app.processor
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_MODULES = ["app.main", "app.processor"]
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for each line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # the header line
+        rows.append((fields[2].strip(), self_us, cumulative_us))
+    return rows
+
+def measure(module: str) -> List[Tuple[str, int, int]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def report(module: str, repeat: int, top: int) -> Dict[str, Any]:
+    best = None
+    for _ in range(repeat):
+        rows = measure(module)
+        total = next(cumulative for name, _, cumulative in reversed(rows) if name == module)
+        if best is None or total < best[0]:
+            best = (total, rows)
+
+    total, rows = best
+    # Top-level packages, so a slow dependency shows up as one line
+    by_package: Dict[str, int] = {}
+    for name, self_us, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    slowest = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    return {
+        "module": module,
+        "importMs": round(total / 1000, 1),
+        "slowestPackagesMs": {package: round(us / 1000, 1) for package, us in slowest},
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", type=lambda value: value.split(","), default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv('IMPORT_BUDGET_MS', '1500')),
+                        help="maximum import time per module")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per module; the fastest counts")
+    parser.add_argument("--top", type=int, default=10, help="slowest packages to list")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for module in args.modules:
+        result = report(module, args.repeat, args.top)
+        result["overBudget"] = result["importMs"] > args.budget_ms
+        results.append(result)
+
+    print(json.dumps({"budgetMs": args.budget_ms, "results": results}, indent=2))
+    if any(result["overBudget"] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Offline load test for the RAG service
+
+Starts the fake OpenAI and Pinecone servers, points the service at them through
+OPENAI_API_BASE and PINECONE_HOST, serves app.main on a local port and drives each
+scenario at the requested concurrency levels. Results are printed (or written) as JSON:
+
+    python -m bench.run --concurrency 1,8,32 --requests 200 --latency-ms 20 --output baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+import numpy as np
+import httpx
+from .fake_servers import BackgroundServer, Faults, create_openai_app, create_pinecone_app
+
+SCENARIOS = ["search", "generate", "knowledge-base", "message-event", "process-document"]
+
+WORKSPACE_ID = "bench-workspace"
+RECEIVER_ID = "bench-user"
+
+QUERIES = [
+    "what did we decide about the release date",
+    "who owns the billing migration",
+    "status of error E1234 in production",
+    "where are the onboarding docs",
+    "summary of yesterday's standup",
+    "is the staging cluster down again",
+    "how do I rotate the API keys",
+    "what is the plan for the offsite",
+]
+
+def rss_mb() -> float:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def configure_environment(openai_url: str, pinecone_url: str):
+    os.environ["OPENAI_API_BASE"] = f"{openai_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["PINECONE_HOST"] = pinecone_url
+    os.environ["PINECONE_API_KEY"] = "bench"
+    os.environ["VECTOR_BACKEND"] = "pinecone"
+    # Redis-backed features are measured separately; keep the run self-contained
+    for name in ("EMBEDDING_CACHE", "ANSWER_CACHE", "SINGLE_FLIGHT", "HYBRID_RETRIEVAL", "MESSAGE_WINDOW"):
+        os.environ.setdefault(name, "false")
+    os.environ.setdefault("VECTOR_MIRROR", "off")
+
+def load_service():
+    """Import the service once the environment points at the fakes"""
+    from app import main, processor
+    from app.embeddings import get_embeddings
+
+    # Celery publishes to an in-memory broker; worker-side scenarios call tasks directly
+    processor.celery_app.conf.broker_url = "memory://"
+    processor.celery_app.conf.result_backend = "cache+memory://"
+
+    # Client-side token counting needs tiktoken's BPE download, which is unavailable offline
+    embeddings = get_embeddings()
+    client = getattr(embeddings, "underlying", embeddings)
+    client.check_embedding_ctx_length = False
+    return main, processor
+
+def seed(processor, openai_url: str, messages: int, documents: int):
+    processor.init_vector_store()
+    batch = [{
+        "id": f"bench-message-{i}",
+        "content": f"{QUERIES[i % len(QUERIES)]} (message {i})",
+        "channelId": f"channel-{i % 4}",
+        "workspaceId": WORKSPACE_ID,
+        "userId": RECEIVER_ID,
+        "userName": "bench",
+        "channelName": "bench",
+        "createdAt": "2024-01-01T00:00:00"
+    } for i in range(messages)]
+    for start in range(0, len(batch), 100):
+        processor.index_message_batch(batch[start:start + 100])
+
+    for i in range(documents):
+        processor.process_document.apply(args=(
+            f"bench-seed-doc-{i}", WORKSPACE_ID, f"{openai_url}/files/seed-{i}.txt",
+            f"seed-{i}.txt", "text/plain"
+        )).get()
+
+def summarize(name: str, concurrency: int, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    completed = len(latencies)
+    latencies_ms = np.asarray(latencies) * 1000 if latencies else np.asarray([0.0])
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": completed + errors,
+        "errors": errors,
+        "durationSeconds": round(elapsed, 3),
+        "throughput": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latencyMs": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 2),
+            "mean": round(float(latencies_ms.mean()), 2),
+            "max": round(float(latencies_ms.max()), 2),
+        },
+        "rssMb": round(rss_mb(), 1),
+        "peakRssMb": round(peak_rss_mb(), 1),
+    }
+
+async def drive(
+    name: str,
+    concurrency: int,
+    total: int,
+    call: Callable[[int], Awaitable[bool]]
+) -> Dict[str, Any]:
+    """Issue total calls with at most concurrency outstanding, timing each one"""
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                ok = await call(i)
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, concurrency, latencies, errors, time.perf_counter() - started)
+
+def scenario_calls(client: httpx.AsyncClient, processor, openai_url: str) -> Dict[str, Callable[[int], Awaitable[bool]]]:
+    async def post(path: str, body: Dict[str, Any]) -> bool:
+        response = await client.post(path, json=body)
+        await response.aread()
+        return response.status_code < 400
+
+    async def search(i: int) -> bool:
+        return await post("/search", {
+            "query": QUERIES[i % len(QUERIES)],
+            "workspaceId": WORKSPACE_ID,
+            "receiverId": RECEIVER_ID,
+            "limit": 5
+        })
+
+    async def generate(i: int) -> bool:
+        return await post("/generate", {
+            "query": f"{QUERIES[i % len(QUERIES)]} #{i}",
+            "workspaceId": WORKSPACE_ID,
+            "receiverId": RECEIVER_ID,
+            "limit": 5
+        })
+
+    async def knowledge_base(i: int) -> bool:
+        return await post("/knowledge-base/generate", {
+            "query": f"{QUERIES[i % len(QUERIES)]} #{i}",
+            "workspaceId": WORKSPACE_ID,
+            "limit": 5
+        })
+
+    async def message_event(i: int) -> bool:
+        return await post("/message-event", {
+            "id": f"bench-event-{i}",
+            "content": f"{QUERIES[i % len(QUERIES)]} (event {i})",
+            "channelId": "channel-0",
+            "workspaceId": WORKSPACE_ID,
+            "userId": RECEIVER_ID,
+            "userName": "bench",
+            "channelName": "bench",
+            "createdAt": datetime.now(timezone.utc).isoformat()
+        })
+
+    async def process_document(i: int) -> bool:
+        # Runs the Celery task body in a thread, as a worker process would
+        result = await asyncio.to_thread(lambda: processor.process_document.apply(args=(
+            f"bench-doc-{i}", WORKSPACE_ID, f"{openai_url}/files/doc-{i}.txt",
+            f"doc-{i}.txt", "text/plain"
+        )).get())
+        return bool(result.get("success"))
+
+    return {
+        "search": search,
+        "generate": generate,
+        "knowledge-base": knowledge_base,
+        "message-event": message_event,
+        "process-document": process_document,
+    }
+
+async def run(args) -> Dict[str, Any]:
+    faults = Faults(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    openai_server = BackgroundServer(create_openai_app(faults, dimensions=args.dimensions)).start()
+    pinecone_server = BackgroundServer(create_pinecone_app(faults)).start()
+    configure_environment(openai_server.url, pinecone_server.url)
+
+    main, processor = load_service()
+    await asyncio.to_thread(seed, processor, openai_server.url, args.seed_messages, args.seed_documents)
+
+    service = BackgroundServer(main.app, lifespan="on").start()
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=service.url, limits=limits, timeout=120.0) as client:
+            calls = scenario_calls(client, processor, openai_server.url)
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    total = args.requests if name != "process-document" else args.documents
+                    await drive(name, concurrency, min(concurrency, total), calls[name])  # warm-up
+                    result = await drive(name, concurrency, total, calls[name])
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+    finally:
+        service.stop()
+        pinecone_server.stop()
+        openai_server.stop()
+
+    return {
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "latencyMs": args.latency_ms,
+            "errorRate": args.error_rate,
+            "dimensions": args.dimensions,
+            "seedMessages": args.seed_messages,
+            "seedDocuments": args.seed_documents,
+        },
+        "results": results,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), default=SCENARIOS,
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=lambda value: [int(c) for c in value.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--documents", type=int, default=10, help="documents per process-document run")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latency added to every fake API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake API calls that fail")
+    parser.add_argument("--dimensions", type=int, default=3072, help="native size of fake embeddings")
+    parser.add_argument("--seed-messages", type=int, default=1000)
+    parser.add_argument("--seed-documents", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/bin/bash
 redis-server --daemonize yes
-celery -A app.processor.celery_app worker --loglevel=info &
+# Skip the startup sync with other workers so new replicas start consuming at once
+celery -A app.processor.celery_app worker --loglevel=info --without-mingle --without-gossip &
 uvicorn app.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
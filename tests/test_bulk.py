@@ -0,0 +1,45 @@
+import asyncio
+import gzip
+import pytest
+from app import bulk
+from app.bulk import iter_ndjson_lines
+
+BODY = b'{"a": 1}\n{"b": 2}\nnot json\n[1]\n\n{"c": 3}'
+
+def parse(data: bytes, chunk_size: int, **kwargs):
+    async def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    async def collect():
+        return [item async for item in iter_ndjson_lines(chunks(), **kwargs)]
+    return asyncio.run(collect())
+
+def summary(results):
+    return [(line_no, "error" if isinstance(record, Exception) else record) for line_no, record in results]
+
+EXPECTED = [(1, {"a": 1}), (2, {"b": 2}), (3, "error"), (4, "error"), (6, {"c": 3})]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 4096])
+def test_plain_body(chunk_size):
+    assert summary(parse(BODY, chunk_size)) == EXPECTED
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 4096])
+def test_gzip_body_detected_from_magic(chunk_size):
+    assert summary(parse(gzip.compress(BODY), chunk_size)) == EXPECTED
+
+def test_concatenated_gzip_members():
+    data = gzip.compress(BODY[:12]) + gzip.compress(BODY[12:])
+    assert summary(parse(data, 5)) == EXPECTED
+
+def test_content_encoding_gzip():
+    assert summary(parse(gzip.compress(BODY), 1, gzip=True)) == EXPECTED
+
+def test_single_byte_and_empty_bodies():
+    assert summary(parse(b"{", 1)) == [(1, "error")]
+    assert parse(b"", 1) == []
+
+def test_overlong_record_is_rejected(monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_MAX_LINE_BYTES", 16)
+    with pytest.raises(ValueError):
+        parse(b'{"a": "' + b"x" * 64 + b'"}\n', 8)
@@ -0,0 +1,34 @@
+import pytest
+from app import context_packer
+from app.context_packer import pack_context, truncate_to_tokens, MIN_TRUNCATED_TOKENS
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Count tokens as len/4 instead of downloading tiktoken's BPE files
+    monkeypatch.setattr(context_packer, "_encoding", None)
+    monkeypatch.setattr(context_packer, "_next_attempt", float("inf"))
+
+def test_packs_best_score_first():
+    packed, used = pack_context([("low", 0.1), ("high", 0.9), ("mid", 0.5)], budget=100, separator="\n")
+    assert packed == ["high", "mid", "low"]
+    # 1 token each plus two 1-token separators
+    assert used == 5
+
+def test_cuts_overflowing_item_at_sentence_boundary():
+    tail = "First sentence here. " * 20 + "unfinished"
+    packed, used = pack_context([("a" * 40, 1.0), (tail, 0.5)], budget=60, separator="\n")
+    assert packed[0] == "a" * 40
+    assert packed[1].endswith(".")
+    assert used <= 60
+
+def test_drops_tail_too_short_to_truncate():
+    packed, _ = pack_context([("a" * 40, 1.0), ("Sentence. " * 50, 0.5)], budget=10 + MIN_TRUNCATED_TOKENS - 2)
+    assert packed == ["a" * 40]
+
+def test_hard_cuts_first_item_without_sentence_boundary():
+    packed, used = pack_context([("x" * 1000, 1.0), ("short.", 0.5)], budget=50)
+    assert packed == ["x" * 200]
+    assert used == 50
+
+def test_truncate_without_boundary_returns_none():
+    assert truncate_to_tokens("no boundary at all " * 10, 5) is None
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from app import faiss_store
+from app.faiss_store import FaissBackend
+
+DIM = 8
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+
+    def make(start, end, workspace="w"):
+        return [
+            {"id": f"m{i}", "values": rng.normal(size=DIM).tolist(), "metadata": {"workspaceId": workspace, "text": str(i)}}
+            for i in range(start, end)
+        ]
+    return make
+
+def ids(matches):
+    return [match["id"] for match in matches]
+
+def test_second_process_replays_appended_log(tmp_path, vectors):
+    writer, reader = FaissBackend(str(tmp_path)), FaissBackend(str(tmp_path))
+    writer.upsert(vectors(0, 10), namespace="ns")
+    query = np.ones(DIM).tolist()
+    assert ids(reader.query(query, 3, namespace="ns")) == ids(writer.query(query, 3, namespace="ns"))
+
+    # Later appends reach the reader without a reload
+    writer.upsert(vectors(10, 20), namespace="ns")
+    writer.delete(["m0"], namespace="ns")
+    assert sorted(reader.list_ids("m1", namespace="ns")) == ["m1"] + [f"m{i}" for i in range(10, 20)]
+    assert reader.fetch(["m0"], namespace="ns") == {}
+    assert "m15" in reader.fetch(["m15"], namespace="ns")
+
+def test_partial_log_line_is_left_for_the_writer(tmp_path, vectors):
+    writer, reader = FaissBackend(str(tmp_path)), FaissBackend(str(tmp_path))
+    writer.upsert(vectors(0, 3), namespace="ns")
+    with open(writer._get_shard("ns").log_path, "ab") as f:
+        f.write(b'{"op": "upsert", "ids')
+    assert len(list(reader.list_ids("m", namespace="ns"))) == 3
+
+def test_filter_and_top_k(tmp_path, vectors):
+    backend = FaissBackend(str(tmp_path))
+    backend.upsert(vectors(0, 5, "a") + vectors(5, 10, "b"))
+    matches = backend.query(np.ones(DIM).tolist(), 10, {"workspaceId": "b"}, include_values=True)
+    assert sorted(ids(matches)) == [f"m{i}" for i in range(5, 10)]
+    assert all(len(match["values"]) == DIM for match in matches)
+    assert len(backend.query(np.ones(DIM).tolist(), 2)) == 2
+
+def test_snapshot_switches_generation_through_manifest(tmp_path, vectors, monkeypatch):
+    monkeypatch.setattr(faiss_store, "FAISS_SNAPSHOT_BYTES", 2000)
+    writer, reader = FaissBackend(str(tmp_path)), FaissBackend(str(tmp_path))
+    writer.upsert(vectors(0, 3), namespace="ns")
+    assert len(list(reader.list_ids("m", namespace="ns"))) == 3
+    for start in range(3, 30, 3):
+        writer.upsert(vectors(start, start + 3), namespace="ns")
+
+    files = sorted(os.listdir(tmp_path))
+    assert "ns.manifest" in files
+    # Only the current generation is left behind
+    assert len([name for name in files if name.startswith("ns.faiss.")]) == 1
+    assert len(list(reader.list_ids("m", namespace="ns"))) == 30
+    assert len(list(FaissBackend(str(tmp_path)).list_ids("m", namespace="ns"))) == 30
+
+def test_close_saves_and_namespaces_are_listed(tmp_path, vectors):
+    backend = FaissBackend(str(tmp_path))
+    backend.upsert(vectors(0, 2), namespace="one")
+    backend.upsert(vectors(2, 4))
+    backend.close()
+    reopened = FaissBackend(str(tmp_path))
+    assert sorted(reopened.namespaces()) == ["", "one"]
+    assert sorted(reopened.list_ids("m", namespace="one")) == ["m0", "m1"]
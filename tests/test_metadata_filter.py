@@ -0,0 +1,42 @@
+from collections import defaultdict
+import pytest
+from app.metadata_filter import matches_filter, filter_candidates, INDEXED_FIELDS
+
+RECORD = {"workspaceId": "w", "userId": "u", "chunk": 3, "tags": "x"}
+
+@pytest.mark.parametrize("filter, expected", [
+    ({"workspaceId": "w"}, True),
+    ({"workspaceId": {"$eq": "other"}}, False),
+    ({"userId": {"$ne": "v"}}, True),
+    ({"userId": {"$in": ["u", "v"]}}, True),
+    ({"userId": {"$nin": ["u"]}}, False),
+    ({"documentId": {"$exists": False}}, True),
+    ({"chunk": {"$gte": 3, "$lt": 4}}, True),
+    ({"chunk": {"$gt": 3}}, False),
+    ({"missing": {"$lt": 1}}, False),
+    ({"$and": [{"workspaceId": "w"}, {"chunk": {"$lte": 2}}]}, False),
+    ({"$or": [{"workspaceId": "x"}, {"chunk": {"$lte": 3}}]}, True),
+])
+def test_matches_filter(filter, expected):
+    assert matches_filter(RECORD, filter) is expected
+
+def test_unsupported_operator():
+    with pytest.raises(ValueError):
+        matches_filter(RECORD, {"chunk": {"$regex": "."}})
+
+def test_filter_candidates_uses_postings_then_full_filter():
+    metadata = {
+        0: {"workspaceId": "w", "userId": "u", "chunk": 1},
+        1: {"workspaceId": "w", "userId": "v", "chunk": 2},
+        2: {"workspaceId": "z", "userId": "u", "chunk": 3},
+    }
+    postings = defaultdict(set)
+    for row, record in metadata.items():
+        for field in INDEXED_FIELDS:
+            if field in record:
+                postings[(field, record[field])].add(row)
+
+    assert sorted(filter_candidates(postings, metadata, {"workspaceId": "w"})) == [0, 1]
+    assert filter_candidates(postings, metadata, {"workspaceId": {"$eq": "w"}, "chunk": {"$gt": 1}}) == [1]
+    assert sorted(filter_candidates(postings, metadata, {"userId": {"$in": ["u"]}})) == [0, 2]
+    assert filter_candidates(postings, metadata, {"workspaceId": "none"}) == []
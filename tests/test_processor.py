@@ -0,0 +1,29 @@
+from app.processor import iter_chunks, iter_batches, CHUNK_SIZE, CHUNK_OVERLAP
+
+def test_short_text_is_one_chunk():
+    assert list(iter_chunks(["hello world"])) == ["hello world"]
+
+def test_chunks_stay_within_size_and_cover_every_page():
+    pages = [" ".join(f"p{page}w{word}" for word in range(400)) for page in range(5)]
+    chunks = list(iter_chunks(pages))
+    assert all(0 < len(chunk) <= CHUNK_SIZE for chunk in chunks)
+    text = " ".join(chunks)
+    for page in range(5):
+        for word in (0, 199, 399):
+            assert f"p{page}w{word}" in text
+
+def test_small_pages_share_a_chunk():
+    assert list(iter_chunks(["page one", "page two"])) == ["page one\n\npage two"]
+
+def test_matches_splitting_the_whole_text():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    pages = [" ".join(f"p{page}w{word}" for word in range(300)) for page in range(4)]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    assert list(iter_chunks(pages)) == splitter.split_text("\n\n".join(pages))
+
+def test_empty_pages():
+    assert list(iter_chunks([])) == []
+
+def test_iter_batches():
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_batches([], 2)) == []
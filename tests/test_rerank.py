@@ -0,0 +1,23 @@
+from app.rerank import mmr_select, normalize_fragment
+
+def test_normalize_fragment_strips_markup():
+    assert normalize_fragment("<p>BTS!&amp;</p>  <p>ok</p>") == normalize_fragment("bts!& ok")
+
+def test_empty_candidates():
+    assert mmr_select([1.0, 0.0], [], [], 3) == []
+    assert mmr_select([1.0, 0.0], [[1.0, 0.0]], ["a"], 0) == []
+
+def test_repeated_text_is_dropped():
+    picked = mmr_select([1.0, 0.0], [[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]], ["same", "<b>Same</b>", "other"], 3)
+    assert picked == [0, 2]
+
+def test_near_duplicate_vectors_are_dropped():
+    vectors = [[1.0, 0.0], [0.999, 0.001], [0.5, 0.5]]
+    picked = mmr_select([1.0, 0.0], vectors, ["a", "b", "c"], 3, duplicate_threshold=0.95)
+    assert picked == [0, 2]
+
+def test_prefers_diverse_results():
+    vectors = [[1.0, 0.0, 0.0], [0.9, 0.3, 0.0], [0.8, 0.0, 0.6]]
+    picked = mmr_select([1.0, 0.1, 0.1], vectors, ["a", "b", "c"], 2, lambda_mult=0.5, duplicate_threshold=1.1)
+    assert picked[0] == 0
+    assert len(picked) == 2
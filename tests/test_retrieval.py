@@ -0,0 +1,24 @@
+from langchain_core.documents import Document
+from app.retrieval import reciprocal_rank_fusion, match_to_document, RRF_K
+
+def doc(vid):
+    return Document(id=vid, page_content=vid)
+
+def test_fusion_sums_reciprocal_ranks():
+    dense = [(doc("a"), 0.9), (doc("b"), 0.8)]
+    sparse = [(doc("b"), 7.0), (doc("c"), 3.0)]
+    fused = reciprocal_rank_fusion([dense, sparse], k=3)
+    assert [d.id for d, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / (RRF_K + 2) + 1 / (RRF_K + 1)
+
+def test_fusion_keeps_k_and_first_copy():
+    first = doc("a")
+    fused = reciprocal_rank_fusion([[(first, 1.0)], [(doc("a"), 1.0), (doc("b"), 0.5)]], k=1)
+    assert len(fused) == 1
+    assert fused[0][0] is first
+
+def test_match_without_text_is_skipped():
+    assert match_to_document({"id": "x", "metadata": {}}) is None
+    document = match_to_document({"id": "x", "metadata": {"text": "hi", "userId": "u"}})
+    assert document.page_content == "hi"
+    assert document.metadata == {"userId": "u"}
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from app.vector_mirror import VectorMirror
+
+DIM = 16
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+
+    def make(start, end):
+        return [
+            {"id": f"v{i}", "values": rng.standard_normal(DIM).tolist(), "metadata": {"workspaceId": "w", "text": str(i)}}
+            for i in range(start, end)
+        ]
+    return make
+
+def ids(matches):
+    return [match["id"] for match in matches]
+
+@pytest.mark.parametrize("code_type", ["int8", "float16"])
+def test_incomplete_shard_defers_to_backend(tmp_path, vectors, code_type):
+    mirror = VectorMirror(str(tmp_path), code_type)
+    mirror.upsert(vectors(0, 10))
+    assert mirror.query(np.ones(DIM).tolist(), 3) is None
+    mirror.mark_complete()
+    assert len(mirror.query(np.ones(DIM).tolist(), 3)) == 3
+
+def test_reader_replays_appends_without_reloading(tmp_path, vectors):
+    writer = VectorMirror(str(tmp_path), "int8")
+    writer.upsert(vectors(0, 20))
+    writer.mark_complete()
+    reader = VectorMirror(str(tmp_path), "int8")
+    query = np.ones(DIM).tolist()
+    reader.query(query, 5)
+
+    shard = reader._shards[""]
+    loads = []
+    load = shard.load
+    shard.load = lambda: (loads.append(1), load())
+    for i in range(20, 40):
+        writer.upsert(vectors(i, i + 1))
+        reader.query(query, 5)
+    writer.delete(["v3"])
+
+    assert ids(reader.query(query, 10, {"workspaceId": "w"})) == ids(writer.query(query, 10, {"workspaceId": "w"}))
+    assert "v3" not in ids(reader.query(query, 40))
+    assert len(shard) == 39
+    assert loads == []
+
+def test_reader_reloads_after_compaction(tmp_path, vectors):
+    writer = VectorMirror(str(tmp_path), "int8")
+    writer.upsert(vectors(0, 600))
+    writer.mark_complete()
+    reader = VectorMirror(str(tmp_path), "int8")
+    query = np.ones(DIM).tolist()
+    reader.query(query, 5)
+
+    # Rewriting every row more than doubles the file and triggers a compaction
+    for _ in range(3):
+        writer.upsert(vectors(0, 600))
+    assert len(writer._shards[""].full) == 600
+    assert ids(reader.query(query, 10)) == ids(writer.query(query, 10))
+
+def test_partial_log_line_is_skipped(tmp_path, vectors):
+    writer = VectorMirror(str(tmp_path), "int8")
+    writer.upsert(vectors(0, 5))
+    writer.mark_complete()
+    reader = VectorMirror(str(tmp_path), "int8")
+    with open(f"{writer._shards[''].base_path}.jsonl", "ab") as f:
+        f.write(b'{"id": "zz", "ro')
+    assert len(reader.query(np.ones(DIM).tolist(), 10)) == 5
+
+    # The writer drops the torn line before appending
+    writer.upsert(vectors(5, 6))
+    assert "v5" in ids(reader.query(np.ones(DIM).tolist(), 10))
+
+def test_reset_clears_shard(tmp_path, vectors):
+    mirror = VectorMirror(str(tmp_path), "int8")
+    mirror.upsert(vectors(0, 5))
+    mirror.mark_complete()
+    mirror.reset()
+    assert mirror.query(np.ones(DIM).tolist(), 3) is None